@@ -1,3 +1,5 @@
+import time
+from typing import Optional
 from io import BytesIO
 import zipfile
 
@@ -6,153 +8,143 @@ import streamlit as st
 
 from src.io_excel import read_input_excel
 from src.schema import normalize_and_validate_columns
-from src.cleaning import parse_and_cast, make_indicator_inputs
-from src.indicators import compute_indicators
+from src.cleaning import parse_and_cast
 from src.export import to_excel_bytes
-from src.sheets_client import build_sheets_service, get_values, write_values
-from src.retention import filter_keep_last_trading_days
-
-
-CANON_COLS_28 = [
-    "No",
-    "Kode Saham",
+from src.sheets_client import build_sheets_service
+from src.pipeline import (
+    KEEP_DAYS,
+    OUT_A_INDICATORS,
+    OUT_B_INDICATORS,
+    SheetsWriteOptions,
+    merge_db_tables,
+    read_table_df,
+    run_process,
+)
+from src.sheets_payload import DEFAULT_DECIMALS
+from src.jobs import finished_job, start_job
+from src.instrument import DEFAULT_LOG_PATH, StageRecorder, read_jsonl
+from src.ticker_index import TickerIndex
+from src.cold_store import DEFAULT_COLD_DIR, ColdStore, combine_hot_cold
+from src.upload_ledger import DEFAULT_LEDGER_DIR, UploadLedger, file_digest, target_key
+from src.screener import CLOSE_VS_52WH, OPS as SCREEN_OPS, VOL_RATIO_20D, ScreenerIndex, add_derived_columns
+
+
+SCREENER_DEFAULT_CONDITIONS = pd.DataFrame(
+    [
+        {"Kolom": "RSI-9", "Operator": "<", "Nilai": 30.0},
+        {"Kolom": CLOSE_VS_52WH, "Operator": ">=", "Nilai": -2.0},
+    ]
+)
+
+SCREENER_SHOW_COLS = [
     "Nama Perusahaan",
-    "Remarks",
-    "Sebelumnya",
-    "Open Price",
-    "Tanggal Perdagangan Terakhir",
-    "First Trade",
-    "Tertinggi",
-    "Terendah",
     "Penutupan",
-    "Selisih",
     "Volume",
-    "Nilai",
-    "Frekuensi",
-    "Index Individual",
-    "Offer",
-    "Offer Volume",
-    "Bid",
-    "Bid Volume",
-    "Listed Shares",
-    "Tradeble Shares",
-    "Weight For Index",
-    "Foreign Sell",
-    "Foreign Buy",
-    "Non Regular Volume",
-    "Non Regular Value",
-    "Non Regular Frequency",
+    "RSI-9",
+    "%K Stoch-9",
+    "MFI-14 (Money Flow Index)",
+    "52-Week High",
+    CLOSE_VS_52WH,
+    VOL_RATIO_20D,
 ]
 
-KEY_COLS = ["Tanggal Perdagangan Terakhir", "Kode Saham", "Nama Perusahaan"]
-KEY2 = ["Tanggal Perdagangan Terakhir", "Kode Saham"]
+
+def _render_screener(db_history: pd.DataFrame):
+    if st.session_state.get("screener_index") is None:
+        with st.spinner("Membangun index screener..."):
+            st.session_state.screener_index = ScreenerIndex(add_derived_columns(db_history)).build(
+                ["RSI-9", "%K Stoch-9", "MFI-14 (Money Flow Index)", CLOSE_VS_52WH, VOL_RATIO_20D]
+            )
+    idx = st.session_state.screener_index
+
+    screen_cols = sorted(idx.available)
+    conds_df = st.data_editor(
+        SCREENER_DEFAULT_CONDITIONS,
+        num_rows="dynamic",
+        column_config={
+            "Kolom": st.column_config.SelectboxColumn("Kolom", options=screen_cols, required=True),
+            "Operator": st.column_config.SelectboxColumn("Operator", options=list(SCREEN_OPS), required=True),
+            "Nilai": st.column_config.NumberColumn("Nilai", required=True),
+        },
+        key="screener_conditions",
+        use_container_width=True,
+    )
+
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        sort_by = st.selectbox("Urutkan berdasarkan", screen_cols, index=screen_cols.index(VOL_RATIO_20D))
+    with c2:
+        ascending = st.checkbox("Ascending", value=False, key="screener_asc")
+    with c3:
+        top = st.number_input("Top N per tanggal (0 = semua)", min_value=0, value=50, step=10)
+    with c4:
+        n_dates = st.number_input(
+            "Jumlah tanggal terakhir", min_value=1, max_value=len(idx.dates), value=1, step=1
+        )
+
+    conditions = [
+        (r["Kolom"], r["Operator"], float(r["Nilai"]))
+        for _, r in conds_df.dropna(subset=["Kolom", "Operator", "Nilai"]).iterrows()
+    ]
+    dates = idx.dates[-int(n_dates):]
+
+    t0 = time.perf_counter()
+    result = idx.screen(
+        conditions,
+        dates=dates,
+        sort_by=sort_by,
+        ascending=ascending,
+        top=int(top) or None,
+        columns=[c for c in SCREENER_SHOW_COLS if c in idx.text_columns or c in idx.available],
+    )
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+
+    st.caption(f"{len(result)} baris dari {len(dates)} tanggal ({elapsed_ms:.1f} ms)")
+    st.dataframe(result, use_container_width=True)
 
 
-OUT_A_INDICATORS = [
+PRICE_OVERLAY_COLS = [
     "SMA-5",
-    "OBV",
-    "TR",
-    "ATR-9",
-    "Gain Harian",
-    "Loss Harian",
-    "AvgGain-9",
-    "AvgLoss-9",
-    "RSI-9",
-    "Min Low-9",
-    "Max High-9",
-    "%K Stoch-9",
-    "%D Stoch-3",
-    "VWAP-5",
-    "MFM",
-    "CMF-9",
+    "EMA-5",
+    "EMA-12",
+    "EMA-20",
     "MA-20",
     "MA-50",
-    "Vol 20D Avg",
-    "4-Week High",
-]
-
-OUT_B_INDICATORS = [
-    "8-Week High",
-    "13-Week High",
-    "52-Week High",
-    "BB Middle",
+    "VWAP-5",
     "BB Upper",
+    "BB Middle",
     "BB Lower",
-    "Std Dev 20D",
-    "EMA-5",
-    "EMA-12",
-    "MFI-14 (Money Flow Index)",
-    "ADL (Accumulation/Distribution Line)",
-    "VPT (Volume Price Trend)",
-    "Range Ratio (Daily Range / ATR)",
-    "Close Position % (0-100%)",
-    "Force Index (Raw)",
-    "Force Index EMA-13",
     "Keltner Upper",
     "Keltner Lower",
-    "EMA-20",
+    "4-Week High",
+    "8-Week High",
+    "13-Week High",
+    "52-Week High",
 ]
 
 
-def _read_sheet_as_df(service, spreadsheet_id: str, sheet_name: str) -> pd.DataFrame:
-    values = get_values(service, spreadsheet_id, f"{sheet_name}!A1:ZZ")
-    if not values:
-        return pd.DataFrame()
-
-    header = values[0]
-    rows = values[1:]
-    if not rows:
-        return pd.DataFrame(columns=header)
-
-    width = len(header)
-    norm_rows = [(r + [""] * (width - len(r)))[:width] for r in rows]
-    return pd.DataFrame(norm_rows, columns=header)
-
-
-def _df_to_values(df: pd.DataFrame):
-    return [df.columns.tolist()] + df.astype(object).where(pd.notnull(df), "").values.tolist()
-
+def _render_ticker_view(db_history: pd.DataFrame):
+    if st.session_state.get("ticker_index") is None:
+        with st.spinner("Membangun index emiten..."):
+            st.session_state.ticker_index = TickerIndex(db_history)
+    tidx = st.session_state.ticker_index
 
-def _upsert_by_key(existing: pd.DataFrame, incoming: pd.DataFrame, key_cols: list[str]) -> pd.DataFrame:
-    if existing is None or existing.empty:
-        out = incoming.copy()
-        return out
-
-    # Samakan kolom: pastikan existing punya semua kolom incoming
-    for c in incoming.columns:
-        if c not in existing.columns:
-            existing[c] = ""
-
-    for c in existing.columns:
-        if c not in incoming.columns:
-            incoming[c] = ""
-
-    existing = existing[incoming.columns.tolist()]
-
-    ex = existing.copy()
-    inc = incoming.copy()
-
-    for c in key_cols:
-        ex[c] = ex[c].astype(str)
-        inc[c] = inc[c].astype(str)
-
-    ex_idx = ex.set_index(key_cols, drop=False)
-    inc_idx = inc.set_index(key_cols, drop=False)
-
-    ex_idx.update(inc_idx)
-    new_keys = inc_idx.index.difference(ex_idx.index)
-    appended = pd.concat([ex_idx, inc_idx.loc[new_keys]], axis=0)
-
-    out = appended.reset_index(drop=True)
-    return out
+    tickers = tidx.tickers
+    ticker = st.selectbox("Kode Saham", tickers, key="ticker_view_code")
+    overlays = st.multiselect(
+        "Overlay harga", PRICE_OVERLAY_COLS, default=["MA-20", "BB Upper", "BB Lower"], key="ticker_view_overlays"
+    )
+    other_cols = [c for c in OUT_A_INDICATORS + OUT_B_INDICATORS if c not in PRICE_OVERLAY_COLS]
+    indicators = st.multiselect("Indikator", other_cols, default=["RSI-9"], key="ticker_view_indicators")
 
+    hist = tidx.history(ticker, ["Penutupan", "Volume", "Vol 20D Avg"] + overlays + indicators)
 
-def _sort_date_emiten(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
-    out["Tanggal Perdagangan Terakhir"] = pd.to_datetime(out["Tanggal Perdagangan Terakhir"], errors="coerce")
-    out = out.sort_values(["Tanggal Perdagangan Terakhir", "Kode Saham"], kind="mergesort")
-    out["Tanggal Perdagangan Terakhir"] = out["Tanggal Perdagangan Terakhir"].dt.date.astype(str)
-    return out
+    st.caption(f"{ticker}: {len(hist)} hari perdagangan")
+    st.line_chart(hist[["Penutupan"] + overlays])
+    st.bar_chart(hist[["Volume"]])
+    for c in indicators:
+        st.write(c)
+        st.line_chart(hist[[c]])
 
 
 st.set_page_config(page_title="Stock Indicators", layout="wide")
@@ -167,158 +159,175 @@ raw_id_db = st.secrets["SPREADSHEET_RAW_ID"]
 out_a_id_db = st.secrets["SPREADSHEET_OUTPUT_A_ID"]
 out_b_id_db = st.secrets["SPREADSHEET_OUTPUT_B_ID"]
 
+# Arsip cold (Parquet per bulan) untuk histori yang keluar dari hot window Sheets
+COLD_STORE_DIR = st.secrets.get("COLD_STORE_DIR", DEFAULT_COLD_DIR)
+INDICATOR_LOOKBACK_DAYS = int(st.secrets.get("INDICATOR_LOOKBACK_DAYS", KEEP_DAYS))
+
+# Sharding per bulan: tabel dipecah ke tab/spreadsheet, dicatat di tab _MANIFEST.
+# SHARD_SPREADSHEET_IDS opsional, mis. {"RAW": ["id1", "id2"], "OUTPUT_A": [...]}
+SHEETS_SHARDING = bool(st.secrets.get("SHEETS_SHARDING", False))
+SHARD_SPREADSHEET_IDS = {k: list(v) for k, v in dict(st.secrets.get("SHARD_SPREADSHEET_IDS", {})).items()}
+if SHEETS_SHARDING:
+    _no_pool = [t for t in ("RAW", "OUTPUT_A", "OUTPUT_B") if not SHARD_SPREADSHEET_IDS.get(t)]
+    if _no_pool:
+        # shard di spreadsheet yang sama tidak menambah batas sel; migrasi tabel ini akan ditolak
+        st.warning(
+            "SHEETS_SHARDING aktif tanpa SHARD_SPREADSHEET_IDS untuk: " + ", ".join(_no_pool)
+            + ". Tabel tersebut tidak akan dimigrasi ke shard."
+        )
+
+# Payload tulis ke Sheets: desimal kolom indikator + batas ukuran body per request
+SHEETS_DECIMALS = st.secrets.get("SHEETS_DECIMALS", DEFAULT_DECIMALS)
+SHEETS_MAX_REQUEST_BYTES = st.secrets.get("SHEETS_MAX_REQUEST_BYTES", None)
+
 if "db_loaded" not in st.session_state:
     st.session_state.db_loaded = False
 
+include_cold = st.checkbox("Sertakan arsip lama (cold store)", value=False, key="db_include_cold")
+
+# range yang dimuat: tabel ber-shard hanya membaca shard yang overlap (kosong = semua)
+load_range = st.date_input("Range tanggal yang dimuat (kosong = semua)", value=[], key="db_load_range")
+load_start = load_range[0] if len(load_range) >= 1 else None
+load_end = load_range[1] if len(load_range) == 2 else None
+
 if st.button("Load DB", key="btn_load_db"):
-    raw_db = _read_sheet_as_df(service_db, raw_id_db, "RAW")
-    out_a_db = _read_sheet_as_df(service_db, out_a_id_db, "OUTPUT_A")
-    out_b_db = _read_sheet_as_df(service_db, out_b_id_db, "OUTPUT_B")
+    sa_info_db = dict(st.secrets["google_service_account"])
+    raw_db = read_table_df(service_db, sa_info_db, raw_id_db, "RAW", start=load_start, end=load_end)
+    out_a_db = read_table_df(service_db, sa_info_db, out_a_id_db, "OUTPUT_A", start=load_start, end=load_end)
+    out_b_db = read_table_df(service_db, sa_info_db, out_b_id_db, "OUTPUT_B", start=load_start, end=load_end)
+
+    if include_cold:
+        raw_db = combine_hot_cold(raw_db, ColdStore(COLD_STORE_DIR, "RAW"), start=load_start, end=load_end)
+        out_a_db = combine_hot_cold(out_a_db, ColdStore(COLD_STORE_DIR, "OUTPUT_A"), start=load_start, end=load_end)
+        out_b_db = combine_hot_cold(out_b_db, ColdStore(COLD_STORE_DIR, "OUTPUT_B"), start=load_start, end=load_end)
 
     st.session_state.raw_db = raw_db
     st.session_state.out_a_db = out_a_db
     st.session_state.out_b_db = out_b_db
     st.session_state.db_loaded = True
 
+    # gabungan RAW + OUTPUT_A/B dan index screener/emiten dibangun ulang dari data baru
+    st.session_state.db_history = None
+    st.session_state.screener_index = None
+    st.session_state.ticker_index = None
+
     st.success(f"Loaded DB: RAW={len(raw_db)} rows, OUT_A={len(out_a_db)} rows, OUT_B={len(out_b_db)} rows")
 
 if st.session_state.db_loaded:
-    raw_db = st.session_state.raw_db.copy()
-    out_a_db = st.session_state.out_a_db.copy()
-    out_b_db = st.session_state.out_b_db.copy()
-
-    if raw_db.empty:
+    if st.session_state.raw_db.empty:
         st.warning("RAW masih kosong, tidak ada data untuk didownload.")
         st.stop()
 
-    # Range berdasarkan RAW (source-of-truth tanggal)
-    raw_db["Tanggal Perdagangan Terakhir"] = pd.to_datetime(
-        raw_db["Tanggal Perdagangan Terakhir"], errors="coerce"
-    ).dt.date
-
-    min_d = raw_db["Tanggal Perdagangan Terakhir"].min()
-    max_d = raw_db["Tanggal Perdagangan Terakhir"].max()
-
-    picked = st.date_input(
-        "Pilih range tanggal (berdasarkan RAW)",
-        value=(min_d, max_d),
-        min_value=min_d,
-        max_value=max_d,
-        key="db_range_picker",
-    )
-
-    # lanjutkan blok start_date,end_date dan merge di sini...
-
-
-    if isinstance(picked, tuple) and len(picked) == 2:
-        start_date, end_date = picked
-
-        # Filter RAW by range
-        raw_range = raw_db[
-            (raw_db["Tanggal Perdagangan Terakhir"] >= start_date) &
-            (raw_db["Tanggal Perdagangan Terakhir"] <= end_date)
-        ].copy()
-
-        # Kunci join harus string (konsisten dengan sheet output)
-        raw_range["Tanggal Perdagangan Terakhir"] = raw_range["Tanggal Perdagangan Terakhir"].astype(str)
-
-        # Pastikan schema OUTPUT_A/B sesuai header source-of-truth
-        out_a_cols = KEY_COLS + OUT_A_INDICATORS
-        out_b_cols = KEY_COLS + OUT_B_INDICATORS
-        out_a_db = out_a_db.reindex(columns=out_a_cols)
-        out_b_db = out_b_db.reindex(columns=out_b_cols)
+    if st.session_state.get("db_history") is None:
+        st.session_state.db_history = merge_db_tables(
+            st.session_state.raw_db, st.session_state.out_a_db, st.session_state.out_b_db
+        )
+    db_history = st.session_state.db_history
+
+    tab_download, tab_screener, tab_ticker = st.tabs(["Download", "Screener", "Emiten"])
+
+    with tab_download:
+        # Range berdasarkan RAW (source-of-truth tanggal)
+        hist_dates = pd.to_datetime(db_history["Tanggal Perdagangan Terakhir"]).dt.date
+        min_d = hist_dates.min()
+        max_d = hist_dates.max()
+
+        picked = st.date_input(
+            "Pilih range tanggal (berdasarkan RAW)",
+            value=(min_d, max_d),
+            min_value=min_d,
+            max_value=max_d,
+            key="db_range_picker",
+        )
 
-        # Buat tanggal output A/B jadi string date, lalu filter range
-        out_a_db["Tanggal Perdagangan Terakhir"] = pd.to_datetime(
-            out_a_db["Tanggal Perdagangan Terakhir"], errors="coerce"
-        ).dt.date.astype(str)
+        if isinstance(picked, tuple) and len(picked) == 2:
+            start_date, end_date = picked
+
+            # Tanggal sudah string YYYY-MM-DD, jadi filter range cukup compare string
+            start_s = str(start_date)
+            end_s = str(end_date)
+            merged = db_history[
+                (db_history["Tanggal Perdagangan Terakhir"] >= start_s) &
+                (db_history["Tanggal Perdagangan Terakhir"] <= end_s)
+            ]
+
+            unique_dates = merged["Tanggal Perdagangan Terakhir"].dropna().unique()
+            n_dates = len(unique_dates)
+
+            if n_dates == 1:
+                # Single trading date -> download 1 XLSX
+                only_date = pd.to_datetime(unique_dates[0]).date()
+                xbytes_db = to_excel_bytes(merged, sheet_name="OUTPUT")
+                fname = f"RekapSahamIndikator-{only_date:%d%m%y}.xlsx"
+
+                st.download_button(
+                    "Download OUTPUT (single date)",
+                    data=xbytes_db,
+                    file_name=fname,
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    key="download_db_single_date",
+                )
+            elif n_dates > 1:
+                # Multi trading dates -> ZIP per tanggal
+                zip_buf = BytesIO()
+                with zipfile.ZipFile(zip_buf, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+                    for d, df_day in merged.groupby("Tanggal Perdagangan Terakhir", sort=True):
+                        df_day = df_day.sort_values(["Kode Saham"], kind="mergesort").copy()
+                        xbytes_day = to_excel_bytes(df_day, sheet_name="OUTPUT")
+
+                        d_dt = pd.to_datetime(d).date()
+                        fname_day = f"RekapSahamIndikator-{d_dt:%d%m%y}.xlsx"
+                        zf.writestr(fname_day, xbytes_day)
+
+                zip_buf.seek(0)
+                fname_zip = f"RekapSahamIndikator-{start_date:%d%m%y}-{end_date:%d%m%y}.zip"
+
+                st.download_button(
+                    "Download ZIP (per tanggal)",
+                    data=zip_buf.getvalue(),
+                    file_name=fname_zip,
+                    mime="application/zip",
+                    key="download_db_zip_per_tanggal",
+                )
+            else:
+                st.warning("Tidak ada data pada range tersebut.")
 
-        out_b_db["Tanggal Perdagangan Terakhir"] = pd.to_datetime(
-            out_b_db["Tanggal Perdagangan Terakhir"], errors="coerce"
-        ).dt.date.astype(str)
+        else:
+            st.info("Pilih start dan end date dulu.")
 
-        start_s = str(start_date)
-        end_s = str(end_date)
+    with tab_screener:
+        _render_screener(db_history)
 
-        out_a_range = out_a_db[
-            (out_a_db["Tanggal Perdagangan Terakhir"] >= start_s) &
-            (out_a_db["Tanggal Perdagangan Terakhir"] <= end_s)
-        ].copy()
+    with tab_ticker:
+        _render_ticker_view(db_history)
 
-        out_b_range = out_b_db[
-            (out_b_db["Tanggal Perdagangan Terakhir"] >= start_s) &
-            (out_b_db["Tanggal Perdagangan Terakhir"] <= end_s)
-        ].copy()
 
-        # Robust: jangan join pakai Nama Perusahaan (ambil dari RAW saja)
-        out_a_range = out_a_range.drop(columns=["Nama Perusahaan"], errors="ignore")
-        out_b_range = out_b_range.drop(columns=["Nama Perusahaan"], errors="ignore")
+uploaded = st.file_uploader("Upload file Excel Ringkasan Saham", type=["xlsx"])
 
-        # (Opsional safety) hilangkan duplikat key kalau ada edit manual di Sheets
-        raw_range = raw_range.drop_duplicates(subset=KEY2, keep="last")
-        out_a_range = out_a_range.drop_duplicates(subset=KEY2, keep="last")
-        out_b_range = out_b_range.drop_duplicates(subset=KEY2, keep="last")
+if "validated_df" not in st.session_state:
+    st.session_state.validated_df = None
 
-        merged = (
-            raw_range[CANON_COLS_28]
-            .merge(out_a_range, how="left", on=KEY2)
-            .merge(out_b_range, how="left", on=KEY2)
-        )
+if "validate_metrics" not in st.session_state:
+    st.session_state.validate_metrics = None
 
-        # Sort final
-        merged["Tanggal Perdagangan Terakhir"] = pd.to_datetime(merged["Tanggal Perdagangan Terakhir"], errors="coerce")
-        merged = merged.sort_values(["Tanggal Perdagangan Terakhir", "Kode Saham"], kind="mergesort")
-        merged["Tanggal Perdagangan Terakhir"] = merged["Tanggal Perdagangan Terakhir"].dt.date.astype(str)
-
-        unique_dates = merged["Tanggal Perdagangan Terakhir"].dropna().unique()
-        n_dates = len(unique_dates)
-        
-        if n_dates == 1:
-            # Single trading date -> download 1 XLSX
-            only_date = pd.to_datetime(unique_dates[0]).date()
-            xbytes_db = to_excel_bytes(merged, sheet_name="OUTPUT")
-            fname = f"RekapSahamIndikator-{only_date:%d%m%y}.xlsx"
-        
-            st.download_button(
-                "Download OUTPUT (single date)",
-                data=xbytes_db,
-                file_name=fname,
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                key="download_db_single_date",
-            )
-        elif n_dates > 1:
-            # Multi trading dates -> ZIP per tanggal
-            zip_buf = BytesIO()
-            with zipfile.ZipFile(zip_buf, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-                for d, df_day in merged.groupby("Tanggal Perdagangan Terakhir", sort=True):
-                    df_day = df_day.sort_values(["Kode Saham"], kind="mergesort").copy()
-                    xbytes_day = to_excel_bytes(df_day, sheet_name="OUTPUT")
-        
-                    d_dt = pd.to_datetime(d).date()
-                    fname_day = f"RekapSahamIndikator-{d_dt:%d%m%y}.xlsx"
-                    zf.writestr(fname_day, xbytes_day)
-        
-            zip_buf.seek(0)
-            fname_zip = f"RekapSahamIndikator-{start_date:%d%m%y}-{end_date:%d%m%y}.zip"
-        
-            st.download_button(
-                "Download ZIP (per tanggal)",
-                data=zip_buf.getvalue(),
-                file_name=fname_zip,
-                mime="application/zip",
-                key="download_db_zip_per_tanggal",
-            )
-        else:
-            st.warning("Tidak ada data pada range tersebut.")
-    
-    else:
-        st.info("Pilih start dan end date dulu.")
+# hash isi file yang menghasilkan validated_df (None = belum ada)
+if "validated_digest" not in st.session_state:
+    st.session_state.validated_digest = None
 
+METRICS_LOG_PATH = st.secrets.get("METRICS_LOG_PATH", DEFAULT_LOG_PATH)
 
-uploaded = st.file_uploader("Upload file Excel Ringkasan Saham", type=["xlsx"])
+# Ledger file upload (hash isi): file identik tidak di-parse / di-upsert ulang
+upload_ledger = UploadLedger(st.secrets.get("UPLOAD_LEDGER_DIR", DEFAULT_LEDGER_DIR))
+uploaded_digest = file_digest(uploaded.getvalue()) if uploaded is not None else None
 
-if "validated_df" not in st.session_state:
-    st.session_state.validated_df = None
+SPREADSHEET_IDS = {
+    "RAW": st.secrets["SPREADSHEET_RAW_ID"],
+    "OUTPUT_A": st.secrets["SPREADSHEET_OUTPUT_A_ID"],
+    "OUTPUT_B": st.secrets["SPREADSHEET_OUTPUT_B_ID"],
+    # opsional: bar mingguan/bulanan + indikatornya
+    "OUTPUT_W": st.secrets.get("SPREADSHEET_OUTPUT_W_ID"),
+    "OUTPUT_M": st.secrets.get("SPREADSHEET_OUTPUT_M_ID"),
+}
 
 col1, col2 = st.columns(2)
 
@@ -328,159 +337,174 @@ with col1:
 with col2:
     do_process = st.button("Process + Upsert + Download")
 
+force_process = st.checkbox(
+    "Proses ulang walaupun file identik sudah pernah di-upsert", value=False, key="force_process"
+)
+
 if do_validate:
     if uploaded is None:
         st.error("Silakan upload file Excel dulu.")
     else:
+        rec = StageRecorder(label="validate")
         try:
-            df0 = read_input_excel(uploaded)
-            df1 = normalize_and_validate_columns(df0)
-            df2 = parse_and_cast(df1)
-            # sorting wajib: tanggal lalu emiten
-            df2 = df2.sort_values(["Tanggal Perdagangan Terakhir", "Kode Saham"], kind="mergesort")
+            with rec.stage("upload_ledger.lookup") as m:
+                df2 = upload_ledger.cached_frame(uploaded_digest)
+                m["rows_out"] = 0 if df2 is None else len(df2)
+            if df2 is not None:
+                st.info("File identik sudah pernah divalidasi; hasil validasi sebelumnya dipakai ulang.")
+            else:
+                with rec.stage("read_input_excel") as m:
+                    df0 = read_input_excel(uploaded)
+                    m["rows_out"] = len(df0)
+                    m["cells_in"] = int(df0.size)
+                df1 = normalize_and_validate_columns(df0)
+                with rec.stage("parse_and_cast", rows_in=len(df1)) as m:
+                    df2 = parse_and_cast(df1)
+                    m["rows_out"] = len(df2)
+                # sorting wajib: tanggal lalu emiten
+                df2 = df2.sort_values(["Tanggal Perdagangan Terakhir", "Kode Saham"], kind="mergesort")
+                upload_ledger.record_validated(uploaded_digest, uploaded.name, df2)
             st.session_state.validated_df = df2
+            st.session_state.validated_digest = uploaded_digest
             st.success("Validasi berhasil.")
             st.dataframe(df2.head(20), use_container_width=True)
         except Exception as e:
             st.session_state.validated_df = None
+            st.session_state.validated_digest = None
             st.error(f"Validasi gagal: {e}")
+        finally:
+            st.session_state.validate_metrics = rec.to_frame()
+            rec.write_jsonl(METRICS_LOG_PATH)
+
+
+if "process_job" not in st.session_state:
+    st.session_state.process_job = None
+
+
+def _process_and_record(ledger: UploadLedger, digest: Optional[str], target: str, job=None, **kwargs):
+    # jalan di thread job: entri yang overlap dibatalkan sebelum Sheets ditulis,
+    # hasil dicatat hanya kalau upsert selesai tanpa error
+    if digest is not None:
+        ledger.begin_processing(digest, target)
+    res = run_process(job=job, **kwargs)
+    if digest is not None:
+        ledger.record_processed(digest, target, res)
+    return res
+
 
 if do_process:
+    job = st.session_state.process_job
+    digest = st.session_state.validated_digest
+    target = target_key(SPREADSHEET_IDS)
+    cached = None
+    if digest is not None and not force_process:
+        cached = upload_ledger.processed_result(digest, target)
+
     if st.session_state.validated_df is None:
         st.error("Harus Validate dulu sampai berhasil (no write before validation).")
+    elif uploaded_digest is not None and uploaded_digest != digest:
+        st.error("File upload berubah sejak Validate terakhir. Validate ulang dulu.")
+    elif job is not None and job.running:
+        st.warning("Process masih berjalan, tunggu sampai selesai.")
+    elif cached is not None:
+        # isi file identik dan key-nya belum ditimpa file lain: Sheets tidak disentuh,
+        # cukup sajikan ulang file download run sebelumnya
+        cached.setdefault("metrics", pd.DataFrame())
+        st.session_state.process_job = finished_job(
+            "process", cached, stage="File identik sudah di-upsert; pakai hasil sebelumnya"
+        )
     else:
-        try:
-            # Build Sheets service from secrets
-            service = build_sheets_service(st.secrets["google_service_account"])
-
-            raw_id = st.secrets["SPREADSHEET_RAW_ID"]
-            out_a_id = st.secrets["SPREADSHEET_OUTPUT_A_ID"]
-            out_b_id = st.secrets["SPREADSHEET_OUTPUT_B_ID"]
-
-            df_today_raw = st.session_state.validated_df.copy()
-            df_today_raw["Tanggal Perdagangan Terakhir"] = df_today_raw["Tanggal Perdagangan Terakhir"].astype(str)
-
-            # --- RAW: read existing -> upsert -> write back
-            existing_raw = _read_sheet_as_df(service, raw_id, "RAW")
-            raw_merged = _upsert_by_key(existing_raw, df_today_raw[CANON_COLS_28], ["Tanggal Perdagangan Terakhir", "Kode Saham"])
-            raw_merged = _sort_date_emiten(raw_merged)
-            raw_merged = filter_keep_last_trading_days(raw_merged, "Tanggal Perdagangan Terakhir", keep_days=280)
-            raw_merged = _sort_date_emiten(raw_merged)
-
-            show_debug = st.checkbox("Show debug", value=False)
-            if show_debug:
-                st.write(
-                    "DEBUG: RAW last 15 unique dates:",
-                    pd.Series(raw_merged["Tanggal Perdagangan Terakhir"].unique()).tail(15).tolist()
-                )
-            
-            write_values(service, raw_id, "RAW!A1", _df_to_values(raw_merged))
-
-            # --- Build historis untuk indikator dari RAW (pakai yang sudah tersimpan)
-            # Convert back to numeric/date
-            raw_hist = raw_merged.copy()
-            raw_hist = normalize_and_validate_columns(raw_hist)
-            raw_hist = parse_and_cast(raw_hist)
-
-            # buat input indikator: price 0 -> NaN
-            raw_for_ind = make_indicator_inputs(raw_hist)
-
-            # hitung indikator (per emiten, urutan tanggal dijaga di engine)
-            df_ind = compute_indicators(raw_for_ind)
-
-            # ambil tanggal hari ini saja (sesuai file input)
-            today_dates = pd.to_datetime(st.session_state.validated_df["Tanggal Perdagangan Terakhir"]).dt.date.unique()
-            df_ind["Tanggal Perdagangan Terakhir"] = pd.to_datetime(df_ind["Tanggal Perdagangan Terakhir"]).dt.date
-            df_today_ind = df_ind[df_ind["Tanggal Perdagangan Terakhir"].isin(today_dates)].copy()
-
-            # persiapan OUTPUT A/B
-            out_a_cols = KEY_COLS + OUT_A_INDICATORS
-            out_b_cols = KEY_COLS + OUT_B_INDICATORS
-            
-            # key harus selalu dari input hari ini (agar output tidak kosong)
-            df_today_key = st.session_state.validated_df[KEY_COLS].copy()
-            df_today_key["Tanggal Perdagangan Terakhir"] = df_today_key["Tanggal Perdagangan Terakhir"].astype(str)
-            
-            # indikator hari ini (keyed)
-            df_today_ind2 = df_today_ind.copy()
-            df_today_ind2["Tanggal Perdagangan Terakhir"] = pd.to_datetime(df_today_ind2["Tanggal Perdagangan Terakhir"]).dt.date.astype(str)
-            
-            ind_a = df_today_ind2.reindex(columns=["Tanggal Perdagangan Terakhir", "Kode Saham"] + OUT_A_INDICATORS)
-            ind_b = df_today_ind2.reindex(columns=["Tanggal Perdagangan Terakhir", "Kode Saham"] + OUT_B_INDICATORS)
-            
-            out_a = df_today_key.merge(ind_a, how="left", on=["Tanggal Perdagangan Terakhir", "Kode Saham"]).reindex(columns=out_a_cols)
-            out_b = df_today_key.merge(ind_b, how="left", on=["Tanggal Perdagangan Terakhir", "Kode Saham"]).reindex(columns=out_b_cols)
-
-            # sort wajib untuk output: tanggal lalu emiten
-            out_a = _sort_date_emiten(out_a)
-            out_b = _sort_date_emiten(out_b)
-
-            # upsert ke OUTPUT_A
-            existing_a = _read_sheet_as_df(service, out_a_id, "OUTPUT_A")
-            merged_a = _upsert_by_key(existing_a, out_a, ["Tanggal Perdagangan Terakhir", "Kode Saham"])
-            
-            # sort -> prune 280 hari -> sort lagi (biar rapi)
-            merged_a = _sort_date_emiten(merged_a)
-            merged_a = filter_keep_last_trading_days(
-                merged_a,
-                date_col="Tanggal Perdagangan Terakhir",
-                keep_days=280,
-            )
-            merged_a = _sort_date_emiten(merged_a)
-            
-            write_values(service, out_a_id, "OUTPUT_A!A1", _df_to_values(merged_a))
-
-            # upsert ke OUTPUT_B
-            existing_b = _read_sheet_as_df(service, out_b_id, "OUTPUT_B")
-            merged_b = _upsert_by_key(existing_b, out_b, ["Tanggal Perdagangan Terakhir", "Kode Saham"])
-            
-            # sort -> prune 280 hari -> sort lagi
-            merged_b = _sort_date_emiten(merged_b)
-            merged_b = filter_keep_last_trading_days(
-                merged_b,
-                date_col="Tanggal Perdagangan Terakhir",
-                keep_days=280,
-            )
-            merged_b = _sort_date_emiten(merged_b)
-            
-            write_values(service, out_b_id, "OUTPUT_B!A1", _df_to_values(merged_b))
-
-            # --- generate 1 file excel download: 28 kolom input + semua indikator untuk hari ini
-            df_today_input = st.session_state.validated_df.copy()
-            df_today_input["Tanggal Perdagangan Terakhir"] = df_today_input["Tanggal Perdagangan Terakhir"].astype(str)
-            
-            # build indikator table dengan key, lalu merge by key (bukan concat)
-            ind_cols = ["Tanggal Perdagangan Terakhir", "Kode Saham"] + OUT_A_INDICATORS + OUT_B_INDICATORS
-            
-            df_today_ind2 = df_today_ind.copy()
-            df_today_ind2["Tanggal Perdagangan Terakhir"] = pd.to_datetime(df_today_ind2["Tanggal Perdagangan Terakhir"]).dt.date.astype(str)
-            
-            ind_table = df_today_ind2.reindex(columns=ind_cols).copy()
-            
-            out_download = df_today_input[CANON_COLS_28].merge(
-                ind_table,
-                how="left",
-                on=["Tanggal Perdagangan Terakhir", "Kode Saham"],
-            )
+        # Semua yang dibutuhkan thread diambil di sini; thread tidak boleh akses st.*
+        st.session_state.process_job = start_job(
+            "process",
+            _process_and_record,
+            upload_ledger,
+            digest,
+            target,
+            sa_info=dict(st.secrets["google_service_account"]),
+            spreadsheet_ids=SPREADSHEET_IDS,
+            validated_df=st.session_state.validated_df.copy(),
+            metrics_log_path=METRICS_LOG_PATH,
+            cold_dir=COLD_STORE_DIR,
+            indicator_lookback_days=INDICATOR_LOOKBACK_DAYS,
+            sharding=SHEETS_SHARDING,
+            shard_pools=SHARD_SPREADSHEET_IDS,
+            write_options=SheetsWriteOptions(
+                decimals=None if SHEETS_DECIMALS is None else int(SHEETS_DECIMALS),
+                max_request_bytes=None if SHEETS_MAX_REQUEST_BYTES is None else int(SHEETS_MAX_REQUEST_BYTES),
+            ),
+        )
 
-            # final sort: tanggal, emiten
-            out_download["Tanggal Perdagangan Terakhir"] = pd.to_datetime(out_download["Tanggal Perdagangan Terakhir"], errors="coerce")
-            out_download = out_download.sort_values(["Tanggal Perdagangan Terakhir", "Kode Saham"], kind="mergesort")
-            out_download["Tanggal Perdagangan Terakhir"] = out_download["Tanggal Perdagangan Terakhir"].dt.date.astype(str)
 
-            xbytes = to_excel_bytes(out_download, sheet_name="OUTPUT")
-            st.success("Selesai. Silakan download file output.")
+def _render_debug_panel(res):
+    st.write("DEBUG: RAW last 15 unique dates:", res.get("raw_last_dates", []))
 
-            # Ambil tanggal dari file upload (ambil yang paling baru)
-            dmax = pd.to_datetime(st.session_state.validated_df["Tanggal Perdagangan Terakhir"]).max()
-            ddmmyy = pd.to_datetime(dmax).strftime("%d%m%y")
+    metrics = res["metrics"]
+    if st.session_state.validate_metrics is not None:
+        metrics = pd.concat([st.session_state.validate_metrics, metrics], ignore_index=True)
 
-            st.download_button(
-            "Download OUTPUT (.xlsx)",
-            data=xbytes,
-            file_name=f"RekapSahamIndikator-{ddmmyy}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    cols = ["stage", "wall_s", "rows_in", "rows_out", "cells_in", "cells_out", "rss_peak_mb", "rss_start_mb", "rss_end_mb", "rss_delta_mb", "thread"]
+    st.write("DEBUG: metrik per tahap (run terakhir)")
+    st.dataframe(metrics.reindex(columns=cols), use_container_width=True)
+
+    # Riwayat lintas run dari file JSON lines: total waktu per tahap utama
+    hist = read_jsonl(METRICS_LOG_PATH)
+    if not hist.empty:
+        hist = hist[~hist["stage"].str.contains("/", regex=False)]
+        run_ts = pd.to_datetime(hist.groupby("run_id")["ts"].min())
+        trend = hist.pivot_table(index="run_id", columns="stage", values="wall_s", aggfunc="sum")
+        trend.index = run_ts.reindex(trend.index).values
+        trend = trend.sort_index()
+        st.write(f"DEBUG: riwayat waktu per tahap ({METRICS_LOG_PATH})")
+        st.line_chart(trend)
+
+
+def _render_process_job():
+    job = st.session_state.process_job
+    if job is None:
+        return
+
+    snap = job.snapshot()
+    st.progress(snap["progress"], text=f"{snap['stage']} ({snap['elapsed']:.1f}s)")
+
+    if job.running:
+        return
+
+    # Job baru selesai saat fragment polling: rerun penuh supaya polling berhenti
+    if st.session_state.get("process_job_polling"):
+        st.session_state.process_job_polling = False
+        st.rerun()
+
+    if snap["status"] == "error":
+        st.error(f"Process gagal: {snap['error']}")
+        return
+
+    res = job.result
+    bar_info = "".join(f", {t}={n} rows" for t, n in res.get("bar_rows", {}).items())
+    st.success(
+        f"Selesai dalam {snap['elapsed']:.1f}s. RAW={res['raw_rows']} rows, "
+        f"OUT_A={res['out_a_rows']} rows, OUT_B={res['out_b_rows']} rows{bar_info}. Silakan download file output."
+    )
+    for t, h in res.get("bar_history", {}).items():
+        if h["days"] < h["needed"]:
+            st.warning(
+                f"{t}: histori harian baru {h['days']} dari {h['needed']} hari perdagangan; "
+                "indikator yang belum panas (RSI-9, EMA, ATR-9) dikosongkan sampai histori (hot + cold store) cukup."
             )
 
-        except Exception as e:
-            st.error(f"Process gagal: {e}")
+    show_debug = st.checkbox("Show debug", value=False)
+    if show_debug:
+        _render_debug_panel(res)
+
+    st.download_button(
+        "Download OUTPUT (.xlsx)",
+        data=res["xbytes"],
+        file_name=res["file_name"],
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
+
+# Panel progress di-refresh sendiri (fragment) selama job jalan, tanpa rerun seluruh app
+_job = st.session_state.process_job
+st.session_state.process_job_polling = _job is not None and _job.running
+st.fragment(run_every=1.0 if st.session_state.process_job_polling else None)(_render_process_job)()
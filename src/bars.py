@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from src.indicators import compute_indicators
+
+
+DATE_COL = "Tanggal Perdagangan Terakhir"
+TICKER_COL = "Kode Saham"
+BAR_END_COL = "Tanggal Akhir Bar"
+
+# W = minggu (mulai Senin), M = bulan kalender; tanggal bar = awal periode.
+# Nilainya = rata-rata hari perdagangan per bar, untuk menakar histori harian.
+TRADING_DAYS_PER_BAR = {"W": 5, "M": 21}
+
+BAR_OHLCV = ["Open Price", "Tertinggi", "Terendah", "Penutupan", "Volume", "Nilai"]
+
+BAR_INDICATORS = [
+    "RSI-9",
+    "EMA-5",
+    "EMA-12",
+    "EMA-20",
+    "ATR-9",
+    "%K Stoch-9",
+    "%D Stoch-3",
+    "MFI-14 (Money Flow Index)",
+    "OBV",
+]
+
+BAR_COLS = [DATE_COL, TICKER_COL, BAR_END_COL] + BAR_OHLCV + BAR_INDICATORS
+
+# Indikator rekursif (EMA / Wilder) -> alpha. Nilainya bergantung pada seed di
+# bar pertama; bobot seed tinggal (1 - alpha)^n setelah n bar.
+_RECURSIVE_ALPHA = {
+    "RSI-9": 1 / 9,
+    "EMA-5": 2 / 6,
+    "EMA-12": 2 / 13,
+    "EMA-20": 2 / 21,
+    "ATR-9": 1 / 9,
+}
+# bobot seed yang masih ditoleransi
+SEED_TOLERANCE = 0.01
+
+# bar minimum sebelum indikator rekursif dianggap panas (EMA-20: 47, RSI-9/ATR-9: 40)
+WARMUP_BARS = {
+    c: int(np.ceil(np.log(SEED_TOLERANCE) / np.log(1 - a))) for c, a in _RECURSIVE_ALPHA.items()
+}
+
+
+def bar_lookback_days(timeframe: str) -> int:
+    """Hari perdagangan harian untuk memanaskan indikator bar (W: 245, M: 1029)."""
+    return (max(WARMUP_BARS.values()) + 2) * TRADING_DAYS_PER_BAR[timeframe]
+
+
+def period_start(dates: np.ndarray, timeframe: str) -> np.ndarray:
+    """Awal periode (datetime64[D]) tiap tanggal: Senin untuk W, tanggal 1 untuk M."""
+    d = np.asarray(dates).astype("datetime64[D]")
+    if timeframe == "W":
+        # 1970-01-01 hari Kamis -> Senin = 0
+        weekday = (d.astype(np.int64) + 3) % 7
+        return d - weekday.astype("timedelta64[D]")
+    if timeframe == "M":
+        return d.astype("datetime64[M]").astype("datetime64[D]")
+    raise ValueError(f"Timeframe tidak dikenal: {timeframe}")
+
+
+def _first_valid(v: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    # nilai non-NaN pertama tiap segmen [start, end); NaN kalau segmen kosong semua
+    valid = np.flatnonzero(~np.isnan(v))
+    k = np.searchsorted(valid, starts, side="left")
+    out = np.full(len(starts), np.nan)
+    ok = k < len(valid)
+    ok[ok] = valid[k[ok]] < ends[ok]
+    out[ok] = v[valid[k[ok]]]
+    return out
+
+
+def _last_valid(v: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    valid = np.flatnonzero(~np.isnan(v))
+    k = np.searchsorted(valid, ends, side="left") - 1
+    out = np.full(len(starts), np.nan)
+    ok = k >= 0
+    ok[ok] = valid[k[ok]] >= starts[ok]
+    out[ok] = v[valid[k[ok]]]
+    return out
+
+
+def _segment_reduce(ufunc, v: np.ndarray, starts: np.ndarray, fill: float) -> np.ndarray:
+    # fmax/fmin/add per segmen; NaN diabaikan, segmen yang semuanya NaN -> NaN
+    out = ufunc.reduceat(np.where(np.isnan(v), fill, v), starts)
+    all_nan = np.add.reduceat((~np.isnan(v)).astype(np.int64), starts) == 0
+    out[all_nan] = np.nan
+    return out
+
+
+def build_bars(df_sorted: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """Bar OHLCV per (emiten, periode) dari histori harian urut (emiten, tanggal); harga NaN dilewati."""
+    if df_sorted.empty:
+        return pd.DataFrame(columns=[DATE_COL, TICKER_COL, BAR_END_COL] + BAR_OHLCV)
+
+    dates = pd.to_datetime(df_sorted[DATE_COL]).to_numpy().astype("datetime64[D]")
+    tickers = df_sorted[TICKER_COL].astype(str).to_numpy()
+    periods = period_start(dates, timeframe)
+
+    n = len(dates)
+    change = np.ones(n, dtype=bool)
+    change[1:] = (tickers[1:] != tickers[:-1]) | (periods[1:] != periods[:-1])
+    starts = np.flatnonzero(change)
+    ends = np.append(starts[1:], n)
+
+    def col(c):
+        return pd.to_numeric(df_sorted[c], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+    out = {
+        DATE_COL: periods[starts],
+        TICKER_COL: tickers[starts],
+        BAR_END_COL: dates[ends - 1],
+        "Open Price": _first_valid(col("Open Price"), starts, ends),
+        "Tertinggi": _segment_reduce(np.fmax, col("Tertinggi"), starts, -np.inf),
+        "Terendah": _segment_reduce(np.fmin, col("Terendah"), starts, np.inf),
+        "Penutupan": _last_valid(col("Penutupan"), starts, ends),
+        "Volume": _segment_reduce(np.add, col("Volume"), starts, 0.0),
+        "Nilai": _segment_reduce(np.add, col("Nilai"), starts, 0.0),
+    }
+    return pd.DataFrame(out)
+
+
+def compute_bar_indicators(df_sorted: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """Bar ``timeframe`` + indikator dari engine harian; tanggal hasil string ``YYYY-MM-DD``."""
+    bars = build_bars(df_sorted, timeframe)
+    if bars.empty:
+        return pd.DataFrame(columns=BAR_COLS)
+    # bar yang periodenya mulai sebelum awal window hanya berisi sebagian hari
+    dates = pd.to_datetime(df_sorted[DATE_COL]).to_numpy().astype("datetime64[D]")
+    first_date = dates.min()
+    bars = bars[bars[DATE_COL].to_numpy() >= first_date].reset_index(drop=True)
+    if bars.empty:
+        return pd.DataFrame(columns=BAR_COLS)
+
+    # bar sudah urut (emiten, periode), jadi engine tidak perlu sort ulang
+    out = compute_indicators(bars, presorted=True).reindex(columns=BAR_COLS)
+
+    # emiten yang ada sejak awal window (histori terpotong): indikator rekursif kosong
+    # sampai WARMUP_BARS; OBV tetap kumulatif sejak awal window seperti OBV harian
+    tickers = df_sorted[TICKER_COL].astype(str).to_numpy()
+    truncated = np.isin(out[TICKER_COL].to_numpy(), np.unique(tickers[dates == first_date]))
+    pos = out.groupby(TICKER_COL, sort=False).cumcount().to_numpy()
+    for c, n in WARMUP_BARS.items():
+        out.loc[truncated & (pos < n), c] = np.nan
+    for c in (DATE_COL, BAR_END_COL):
+        out[c] = np.datetime_as_string(out[c].to_numpy().astype("datetime64[D]"), unit="D")
+    return out
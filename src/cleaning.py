@@ -66,9 +66,14 @@ def parse_and_cast(df: pd.DataFrame) -> pd.DataFrame:
 
     out[col] = dt.dt.date
 
+    return cast_numeric(out)
+
+
+def cast_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    # Hanya kolom angka; dipakai juga untuk histori yang tanggalnya sudah ter-parse
+    out = df.copy()
     for c in NUMERIC_COLS:
         out[c] = pd.to_numeric(out[c], errors="coerce")
-
     return out
 
 
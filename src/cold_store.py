@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import os
+import threading
+from typing import List, Optional, Sequence
+
+import pandas as pd
+
+from src.history import SortedHistory
+
+
+DATE_COL = "Tanggal Perdagangan Terakhir"
+KEY2 = ["Tanggal Perdagangan Terakhir", "Kode Saham"]
+TEXT_COLS = ("Kode Saham", "Nama Perusahaan", "Remarks")
+DATE_COLS = (DATE_COL,)
+
+COMPRESSION = "zstd"
+DEFAULT_COLD_DIR = "cold_store"
+
+
+def _normalize_for_parquet(
+    df: pd.DataFrame, text_cols: Sequence[str] = TEXT_COLS, date_cols: Sequence[str] = DATE_COLS
+) -> pd.DataFrame:
+    # Parquet butuh tipe per kolom yang konsisten; nilai dari Sheets campur teks/angka.
+    # Kolom tanggal disimpan sebagai teks YYYY-MM-DD (kosong bila tidak valid).
+    out = pd.DataFrame(index=df.index)
+    for c in df.columns:
+        if c in date_cols:
+            d = pd.to_datetime(df[c], errors="coerce")
+            out[c] = d.dt.strftime("%Y-%m-%d").where(d.notna(), "").astype(str)
+        elif c in text_cols:
+            out[c] = df[c].where(df[c].notna(), "").astype(str)
+        else:
+            out[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    return out
+
+
+class ColdStore:
+    """Arsip histori lama: ``<root>/<table>/<YYYY-MM>.parquet`` (zstd), dibaca per partisi bulan."""
+
+    def __init__(
+        self,
+        root: str,
+        table: str,
+        text_cols: Sequence[str] = TEXT_COLS,
+        date_cols: Sequence[str] = DATE_COLS,
+    ):
+        self.root = root
+        self.table = table
+        self.text_cols = tuple(text_cols)
+        self.date_cols = tuple(dict.fromkeys((DATE_COL, *date_cols)))
+        self.path = os.path.join(root, table)
+        self._lock = threading.Lock()
+
+    def _partition_file(self, month: str) -> str:
+        return os.path.join(self.path, f"{month}.parquet")
+
+    def months(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(f[:-len(".parquet")] for f in os.listdir(self.path) if f.endswith(".parquet"))
+
+    def archive(self, expired: pd.DataFrame) -> int:
+        """Upsert baris yang keluar dari hot window ke partisi bulannya."""
+        if expired is None or expired.empty:
+            return 0
+
+        valid = pd.to_datetime(expired[DATE_COL], errors="coerce").notna()
+        df = _normalize_for_parquet(expired.loc[valid], self.text_cols, self.date_cols)
+        months = df[DATE_COL].str[:7]
+
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            for month, part in df.groupby(months, sort=True):
+                fpath = self._partition_file(month)
+                if os.path.exists(fpath):
+                    existing = pd.read_parquet(fpath)
+                    part = pd.concat([existing, part], ignore_index=True)
+                part = part.drop_duplicates(subset=KEY2, keep="last")
+                part = part.sort_values(KEY2, kind="mergesort").reset_index(drop=True)
+
+                # tulis ke file sementara lalu rename, supaya partisi tidak pernah setengah jadi
+                tmp = fpath + ".tmp"
+                part.to_parquet(tmp, index=False, compression=COMPRESSION)
+                os.replace(tmp, fpath)
+        return len(df)
+
+    def read(self, start=None, end=None, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Baca baris dengan tanggal di [start, end] (inklusif; None = tanpa batas)."""
+        start_s = str(pd.Timestamp(start).date()) if start is not None else None
+        end_s = str(pd.Timestamp(end).date()) if end is not None else None
+
+        cols = None
+        if columns is not None:
+            cols = list(dict.fromkeys(KEY2 + list(columns)))
+
+        parts = []
+        for month in self.months():
+            if start_s is not None and month < start_s[:7]:
+                continue
+            if end_s is not None and month > end_s[:7]:
+                continue
+            parts.append(pd.read_parquet(self._partition_file(month), columns=cols))
+
+        if not parts:
+            return pd.DataFrame(columns=cols or [])
+
+        out = pd.concat(parts, ignore_index=True)
+        if start_s is not None:
+            out = out[out[DATE_COL] >= start_s]
+        if end_s is not None:
+            out = out[out[DATE_COL] <= end_s]
+        return out.reset_index(drop=True)
+
+
+def combine_hot_cold(
+    hot: pd.DataFrame, cold: Optional[ColdStore], start=None, columns: Optional[Sequence[str]] = None, end=None
+) -> pd.DataFrame:
+    """Histori hot (Sheets) + cold (arsip) di [start, end]; baris hot menang bila key sama."""
+    if cold is None:
+        return hot
+    if hot.empty:
+        old = cold.read(start=start, end=end, columns=columns)
+        return hot if old.empty else old
+
+    hot_dates = pd.to_datetime(hot[DATE_COL], errors="coerce")
+    hot_min = hot_dates.min()
+    if start is not None and pd.Timestamp(start) >= hot_min:
+        return hot
+
+    cold_end = hot_min - pd.Timedelta(days=1)
+    if end is not None:
+        cold_end = min(cold_end, pd.Timestamp(end))
+    old = cold.read(start=start, end=cold_end, columns=columns)
+    if old.empty:
+        return hot
+
+    old = old.reindex(columns=hot.columns)
+    out = pd.concat([old, hot], ignore_index=True)
+    out[DATE_COL] = pd.to_datetime(out[DATE_COL], errors="coerce").dt.date.astype(str)
+    return out.drop_duplicates(subset=KEY2, keep="last").reset_index(drop=True)
+
+
+def read_last_trading_days(hot: SortedHistory, cold: Optional[ColdStore], n_days: int) -> SortedHistory:
+    """Histori ``n_days`` hari perdagangan terakhir, menambal dari cold bila hot kurang."""
+    missing = n_days - hot.n_dates
+    if cold is None or len(hot) == 0 or missing <= 0:
+        return hot
+
+    # perkiraan hari kalender (5 hari bursa per 7 hari + buffer libur), lalu dipotong tepat
+    first = pd.Timestamp(hot.unique_dates[0])
+    start = first - pd.Timedelta(days=int(missing * 7 / 5) + 30)
+    old = cold.read(start=start, end=first - pd.Timedelta(days=1))
+    if old.empty:
+        return hot
+
+    # cold seluruhnya lebih lama dari hot: merge run partisi, tanpa sort ulang hot
+    old = SortedHistory.from_frame(old.reindex(columns=hot.frame.columns))
+    out, _ = old.merge(hot).keep_last(n_days)
+    return out
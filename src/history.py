@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+DATE_COL = "Tanggal Perdagangan Terakhir"
+TICKER_COL = "Kode Saham"
+KEY2 = [DATE_COL, TICKER_COL]
+
+
+def _upsert_by_key(existing: pd.DataFrame, incoming: pd.DataFrame, key_cols: list[str]) -> pd.DataFrame:
+    if existing is None or existing.empty:
+        out = incoming.copy()
+        return out
+
+    # Samakan kolom: pastikan existing punya semua kolom incoming
+    for c in incoming.columns:
+        if c not in existing.columns:
+            existing[c] = ""
+
+    for c in existing.columns:
+        if c not in incoming.columns:
+            incoming[c] = ""
+
+    existing = existing[incoming.columns.tolist()]
+
+    ex = existing.copy()
+    inc = incoming.copy()
+
+    for c in key_cols:
+        ex[c] = ex[c].astype(str)
+        inc[c] = inc[c].astype(str)
+
+    ex_idx = ex.set_index(key_cols, drop=False)
+    inc_idx = inc.set_index(key_cols, drop=False)
+
+    ex_idx.update(inc_idx)
+    new_keys = inc_idx.index.difference(ex_idx.index)
+    appended = pd.concat([ex_idx, inc_idx.loc[new_keys]], axis=0)
+
+    out = appended.reset_index(drop=True)
+    return out
+
+
+class SortedHistory:
+    """Histori urut (tanggal, emiten) dipartisi per tanggal; ``dates`` = tanggal hasil parse."""
+
+    def __init__(self, frame: pd.DataFrame, dates: np.ndarray):
+        self.frame = frame
+        self.dates = dates
+        n = len(dates)
+        if n:
+            bounds = np.flatnonzero(dates[1:] != dates[:-1]) + 1
+            self.offsets = np.concatenate([[0], bounds, [n]])
+            self.unique_dates = dates[self.offsets[:-1]]
+        else:
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.unique_dates = dates[:0]
+        self._ticker_perm: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "SortedHistory":
+        """Parse tanggal sekali lalu urutkan (dilewati kalau sudah urut); tanggal invalid dibuang."""
+        if df.empty or DATE_COL not in df.columns:
+            return cls(df.reset_index(drop=True), np.array([], dtype="datetime64[ns]"))
+
+        d = pd.to_datetime(df[DATE_COL], errors="coerce").to_numpy()
+        valid = ~np.isnat(d)
+        if not valid.all():
+            df = df.loc[valid]
+            d = d[valid]
+
+        tickers = df[TICKER_COL].astype(str).to_numpy()
+        if not _is_sorted(d, tickers):
+            order = np.lexsort((tickers, d))
+            df = df.iloc[order]
+            d = d[order]
+
+        frame = df.reset_index(drop=True)
+        frame[DATE_COL] = np.datetime_as_string(d, unit="D")
+        return cls(frame, d)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    @property
+    def n_dates(self) -> int:
+        return len(self.unique_dates)
+
+    def _rows(self, i: int, j: int) -> Tuple[pd.DataFrame, np.ndarray]:
+        # baris partisi tanggal ke-i s/d ke-(j-1)
+        a, b = self.offsets[i], self.offsets[j]
+        return self.frame.iloc[a:b], self.dates[a:b]
+
+    def merge(self, incoming: "SortedHistory") -> "SortedHistory":
+        """Upsert ``incoming`` by (tanggal, emiten) dengan merge run partisi (linear)."""
+        if len(incoming) == 0:
+            return self
+        if len(self) == 0:
+            return incoming
+
+        # posisi tiap tanggal incoming di antara tanggal yang sudah ada
+        pos = np.searchsorted(self.unique_dates, incoming.unique_dates)
+        frames: List[pd.DataFrame] = []
+        dates: List[np.ndarray] = []
+        cur = 0
+        for k, p in enumerate(pos):
+            # run partisi lama yang tidak tersentuh disalin utuh (satu slice)
+            if p > cur:
+                f, d = self._rows(cur, p)
+                frames.append(f)
+                dates.append(d)
+            inc_f, inc_d = incoming._rows(k, k + 1)
+            if p < self.n_dates and self.unique_dates[p] == incoming.unique_dates[k]:
+                old_f, _ = self._rows(p, p + 1)
+                part = _upsert_by_key(old_f.copy(), inc_f.copy(), KEY2)
+                part = part.sort_values(TICKER_COL, kind="mergesort")
+                frames.append(part)
+                dates.append(np.full(len(part), inc_d[0]))
+                cur = p + 1
+            else:
+                frames.append(inc_f)
+                dates.append(inc_d)
+                cur = p
+        if cur < self.n_dates:
+            f, d = self._rows(cur, self.n_dates)
+            frames.append(f)
+            dates.append(d)
+
+        # urutan kolom mengikuti _upsert_by_key: kolom incoming dulu, lalu sisa kolom lama
+        cols = list(incoming.frame.columns) + [c for c in self.frame.columns if c not in incoming.frame.columns]
+        frame = pd.concat(frames, ignore_index=True).reindex(columns=cols)
+        for c in cols:
+            if c not in self.frame.columns or c not in incoming.frame.columns:
+                frame[c] = frame[c].fillna("")
+        return SortedHistory(frame, np.concatenate(dates))
+
+    def upsert(self, incoming: pd.DataFrame) -> "SortedHistory":
+        return self.merge(SortedHistory.from_frame(incoming))
+
+    def keep_last(self, n_days: int) -> Tuple["SortedHistory", pd.DataFrame]:
+        """(hot, expired): N hari perdagangan terakhir + baris yang keluar window."""
+        if self.n_dates <= n_days:
+            return self, self.frame.iloc[0:0]
+        k = self.offsets[self.n_dates - n_days]
+        hot = SortedHistory(self.frame.iloc[k:].reset_index(drop=True), self.dates[k:])
+        return hot, self.frame.iloc[:k]
+
+    def split_before(self, date_str: str) -> Tuple["SortedHistory", pd.DataFrame]:
+        """(hot, expired) dengan hot = tanggal >= ``date_str``."""
+        i = int(np.searchsorted(self.unique_dates, np.datetime64(date_str).astype(self.unique_dates.dtype)))
+        if i == 0:
+            return self, self.frame.iloc[0:0]
+        k = self.offsets[i]
+        hot = SortedHistory(self.frame.iloc[k:].reset_index(drop=True), self.dates[k:])
+        return hot, self.frame.iloc[:k]
+
+    def first_date(self) -> Optional[str]:
+        return str(np.datetime_as_string(self.unique_dates[0], unit="D")) if self.n_dates else None
+
+    def month_slices(self) -> Dict[str, Tuple[int, int]]:
+        """Bulan ``YYYY-MM`` -> rentang baris [start, end); bulan selalu berurutan."""
+        months = np.datetime_as_string(self.unique_dates, unit="M")
+        out: Dict[str, Tuple[int, int]] = {}
+        for i, m in enumerate(months):
+            a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+            out[m] = (out[m][0], b) if m in out else (a, b)
+        return out
+
+    def ticker_order(self) -> np.ndarray:
+        # Frame sudah urut tanggal, jadi sort stabil per kode emiten = urutan (emiten, tanggal).
+        # Kode emiten muat di uint16, jadi argsort stabil numpy = radix/counting sort O(n).
+        if self._ticker_perm is None:
+            codes, uniques = pd.factorize(self.frame[TICKER_COL].astype(str), sort=True)
+            if len(uniques) <= np.iinfo(np.uint16).max:
+                codes = codes.astype(np.uint16)
+            self._ticker_perm = np.argsort(codes, kind="stable")
+        return self._ticker_perm
+
+    def by_ticker(self) -> pd.DataFrame:
+        """Frame urut (emiten, tanggal) dengan kolom tanggal datetime64 (tanpa parse ulang)."""
+        perm = self.ticker_order()
+        out = self.frame.take(perm).reset_index(drop=True)
+        out[DATE_COL] = self.dates[perm]
+        return out
+
+
+def _is_sorted(dates: np.ndarray, tickers: np.ndarray) -> bool:
+    if len(dates) < 2:
+        return True
+    later = dates[1:] > dates[:-1]
+    same = dates[1:] == dates[:-1]
+    return bool(np.all(later | (same & (tickers[1:] >= tickers[:-1]))))
@@ -1,19 +1,26 @@
 import numpy as np
 import pandas as pd
 
+from src.instrument import LapTimer
+
 
 def _wilder_rma(series: pd.Series, period: int) -> pd.Series:
     # Wilder's RMA ~ EMA(alpha=1/period) dengan adjust=False
     return series.ewm(alpha=1 / period, adjust=False, min_periods=period).mean()
 
 
-def compute_indicators(df_hist: pd.DataFrame) -> pd.DataFrame:
+def compute_indicators(df_hist: pd.DataFrame, rec=None, presorted: bool = False) -> pd.DataFrame:
+    # rec: StageRecorder opsional untuk timing per kelompok indikator
+    # presorted: input sudah urut (emiten, tanggal), mis. dari SortedHistory.by_ticker()
+    laps = LapTimer(rec, "compute_indicators", rows=len(df_hist))
     df = df_hist.copy()
     df["Tanggal Perdagangan Terakhir"] = pd.to_datetime(df["Tanggal Perdagangan Terakhir"])
 
     # Wajib: urut per emiten lalu tanggal
-    df = df.sort_values(["Kode Saham", "Tanggal Perdagangan Terakhir"], kind="mergesort")
+    if not presorted:
+        df = df.sort_values(["Kode Saham", "Tanggal Perdagangan Terakhir"], kind="mergesort")
     g = df.groupby("Kode Saham", sort=False)
+    laps.lap("sort + groupby")
 
     close = df["Penutupan"]
     high = df["Tertinggi"]
@@ -34,6 +41,7 @@ def compute_indicators(df_hist: pd.DataFrame) -> pd.DataFrame:
 
     rs = df["AvgGain-9"] / df["AvgLoss-9"]
     df["RSI-9"] = 100 - (100 / (1 + rs))
+    laps.lap("RSI-9")
 
     # =========================
     # 2) Moving averages
@@ -53,12 +61,14 @@ def compute_indicators(df_hist: pd.DataFrame) -> pd.DataFrame:
     df["BB Lower"] = df["BB Middle"] - 2 * df["Std Dev 20D"]
 
     df["Vol 20D Avg"] = g["Volume"].transform(lambda s: s.rolling(20, min_periods=20).mean())
+    laps.lap("MA / EMA / Bollinger")
 
     # Week Highs (hari perdagangan): 4/8/13/52 weeks = 20/40/65/260
     df["4-Week High"] = g["Tertinggi"].transform(lambda s: s.rolling(20, min_periods=20).max())
     df["8-Week High"] = g["Tertinggi"].transform(lambda s: s.rolling(40, min_periods=40).max())
     df["13-Week High"] = g["Tertinggi"].transform(lambda s: s.rolling(65, min_periods=65).max())
     df["52-Week High"] = g["Tertinggi"].transform(lambda s: s.rolling(260, min_periods=260).max())
+    laps.lap("Week Highs")
 
     # =========================
     # 3) ATR (Wilder)
@@ -72,6 +82,7 @@ def compute_indicators(df_hist: pd.DataFrame) -> pd.DataFrame:
 
     df["Range Ratio (Daily Range / ATR)"] = (high - low) / df["ATR-9"]
     df["Close Position % (0-100%)"] = ((close - low) / (high - low)) * 100
+    laps.lap("ATR-9")
 
     # =========================
     # 4) Stochastic
@@ -80,6 +91,7 @@ def compute_indicators(df_hist: pd.DataFrame) -> pd.DataFrame:
     df["Max High-9"] = g["Tertinggi"].transform(lambda s: s.rolling(9, min_periods=9).max())
     df["%K Stoch-9"] = ((close - df["Min Low-9"]) / (df["Max High-9"] - df["Min Low-9"])) * 100
     df["%D Stoch-3"] = g["%K Stoch-9"].transform(lambda s: s.rolling(3, min_periods=3).mean())
+    laps.lap("Stochastic")
 
     # =========================
     # 5) Typical Price family
@@ -93,6 +105,7 @@ def compute_indicators(df_hist: pd.DataFrame) -> pd.DataFrame:
     pv_sum5 = g.apply(lambda x: (((x["Tertinggi"] + x["Terendah"] + x["Penutupan"]) / 3) * x["Volume"]).rolling(5, min_periods=5).sum()).reset_index(level=0, drop=True)
     v_sum5 = g["Volume"].transform(lambda s: s.rolling(5, min_periods=5).sum())
     df["VWAP-5"] = pv_sum5 / v_sum5
+    laps.lap("VWAP-5")
 
     # =========================
     # 6) OBV (seed = volume hari pertama)
@@ -108,6 +121,7 @@ def compute_indicators(df_hist: pd.DataFrame) -> pd.DataFrame:
     signed_vol.loc[first_mask] = vol.loc[first_mask]
 
     df["OBV"] = signed_vol.groupby(df["Kode Saham"], sort=False).cumsum()
+    laps.lap("OBV")
 
     # =========================
     # 7) ADL / CMF
@@ -128,6 +142,7 @@ def compute_indicators(df_hist: pd.DataFrame) -> pd.DataFrame:
     mfv_sum9 = mfv_sum9.groupby(df["Kode Saham"], sort=False).transform(lambda s: s.rolling(9, min_periods=9).sum())
     v_sum9 = g["Volume"].transform(lambda s: s.rolling(9, min_periods=9).sum())
     df["CMF-9"] = mfv_sum9 / v_sum9
+    laps.lap("ADL / CMF-9")
 
     # =========================
     # 8) Force Index
@@ -137,6 +152,7 @@ def compute_indicators(df_hist: pd.DataFrame) -> pd.DataFrame:
     df["Force Index EMA-13"] = g["Force Index (Raw)"].transform(
         lambda s: s.ewm(span=13, adjust=False, min_periods=13).mean()
     )
+    laps.lap("Force Index")
 
     # =========================
     # 9) VPT (seed = 0)
@@ -149,6 +165,7 @@ def compute_indicators(df_hist: pd.DataFrame) -> pd.DataFrame:
     vpt_step2 = vpt_step.copy()
     vpt_step2.loc[first_mask] = 0.0
     df["VPT (Volume Price Trend)"] = vpt_step2.groupby(df["Kode Saham"], sort=False).cumsum()
+    laps.lap("VPT")
 
     # =========================
     # 10) MFI-14 (pakai TP, sesuai definisi)
@@ -165,11 +182,14 @@ def compute_indicators(df_hist: pd.DataFrame) -> pd.DataFrame:
 
     money_ratio = pos_sum14 / neg_sum14
     df["MFI-14 (Money Flow Index)"] = 100 - (100 / (1 + money_ratio))
+    laps.lap("MFI-14")
 
     # =========================
     # 11) Keltner
     # =========================
     df["Keltner Upper"] = df["EMA-20"] + 2 * df["ATR-9"]
     df["Keltner Lower"] = df["EMA-20"] - 2 * df["ATR-9"]
+    laps.lap("Keltner")
+    laps.close()
 
     return df
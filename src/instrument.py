@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:  # opsional; di Linux cukup /proc/self/statm
+    psutil = None
+
+
+DEFAULT_LOG_PATH = os.path.join("logs", "stage_metrics.jsonl")
+
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_mb() -> Optional[float]:
+    # RSS saat ini (bukan high-water mark proses seperti ru_maxrss)
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    if psutil is not None:
+        return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+    return None
+
+
+def _rss_delta(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    return None if start is None or end is None else round(end - start, 1)
+
+
+def _hwm_mb() -> Optional[float]:
+    # VmHWM = peak RSS sejak reset terakhir lewat clear_refs
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _reset_hwm() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+SAMPLE_INTERVAL_S = 0.01
+
+# Peak RSS per tahap yang sedang terbuka (token -> peak sejauh ini). VmHWM milik
+# seluruh proses, jadi sebelum di-reset nilainya dilipat ke semua tahap terbuka;
+# tahap bertingkat/paralel tetap dapat peak yang benar (tapi angka proses, bukan per thread).
+_peak_lock = threading.Lock()
+_open_peaks: Dict[int, Optional[float]] = {}
+_peak_token = 0
+_use_hwm: Optional[bool] = None
+_sampler: Optional[threading.Thread] = None
+
+
+def _fold_peak(value: Optional[float]):
+    if value is None:
+        return
+    for k, v in _open_peaks.items():
+        if v is None or value > v:
+            _open_peaks[k] = value
+
+
+def _sample_loop():
+    # fallback tanpa clear_refs: sampling RSS selama masih ada tahap terbuka
+    global _sampler
+    while True:
+        with _peak_lock:
+            if not _open_peaks:
+                _sampler = None
+                return
+            _fold_peak(rss_mb())
+        time.sleep(SAMPLE_INTERVAL_S)
+
+
+def _peak_begin() -> int:
+    global _peak_token, _use_hwm, _sampler
+    with _peak_lock:
+        if _use_hwm is None:
+            _use_hwm = _hwm_mb() is not None and _reset_hwm()
+        if _use_hwm:
+            _fold_peak(_hwm_mb())
+            _reset_hwm()
+        _peak_token += 1
+        token = _peak_token
+        _open_peaks[token] = rss_mb()
+        if not _use_hwm and _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="rss-sampler", daemon=True)
+            _sampler.start()
+    return token
+
+
+def _peak_end(token: int) -> Optional[float]:
+    with _peak_lock:
+        _fold_peak(_hwm_mb() if _use_hwm else rss_mb())
+        return _open_peaks.pop(token, None)
+
+
+def count_cells(values: List[List[Any]]) -> int:
+    return sum(len(r) for r in values)
+
+
+class StageRecorder:
+    """Kumpulkan waktu, jumlah baris/sel dan RSS (awal, akhir, peak) per tahap pipeline."""
+
+    def __init__(self, run_id: Optional[str] = None, label: str = ""):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.label = label
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def _base_record(self, name: str, rows_in: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            "run_id": self.run_id,
+            "label": self.label,
+            "stage": name,
+            "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "thread": threading.current_thread().name,
+            "rows_in": rows_in,
+            "rows_out": None,
+            "cells_in": None,
+            "cells_out": None,
+        }
+
+    def add(self, rec: Dict[str, Any]):
+        with self._lock:
+            self.records.append(rec)
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None, **extra):
+        # Pemanggil boleh mengisi rows_out / cells_in / cells_out pada dict yang di-yield
+        rec = self._base_record(name, rows_in)
+        rec.update(extra)
+        rec["rss_start_mb"] = rss_mb()
+        peak = _peak_begin()
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec["wall_s"] = round(time.perf_counter() - t0, 4)
+            rec["rss_peak_mb"] = _peak_end(peak)
+            rec["rss_end_mb"] = rss_mb()
+            rec["rss_delta_mb"] = _rss_delta(rec["rss_start_mb"], rec["rss_end_mb"])
+            self.add(rec)
+
+    def to_frame(self) -> pd.DataFrame:
+        with self._lock:
+            return pd.DataFrame(list(self.records))
+
+    def write_jsonl(self, path: str = DEFAULT_LOG_PATH):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        with self._lock:
+            lines = [json.dumps(r, default=str) for r in self.records]
+        with open(path, "a", encoding="utf-8") as f:
+            for line in lines:
+                f.write(line + "\n")
+
+
+class LapTimer:
+    """Catat durasi dan peak RSS antar titik (lap) dalam satu fungsi panjang, mis. per indikator."""
+
+    def __init__(self, rec: Optional[StageRecorder], prefix: str, rows: Optional[int] = None):
+        self.rec = rec
+        self.prefix = prefix
+        self.rows = rows
+        self._t = time.perf_counter()
+        self._rss = rss_mb()
+        self._peak = _peak_begin() if rec is not None else None
+
+    def lap(self, name: str):
+        now = time.perf_counter()
+        if self.rec is not None:
+            rec = self.rec._base_record(f"{self.prefix}/{name}", self.rows)
+            rec["rows_out"] = self.rows
+            rec["wall_s"] = round(now - self._t, 4)
+            rec["rss_start_mb"] = self._rss
+            rec["rss_peak_mb"] = _peak_end(self._peak)
+            rec["rss_end_mb"] = rss_mb()
+            rec["rss_delta_mb"] = _rss_delta(rec["rss_start_mb"], rec["rss_end_mb"])
+            self.rec.add(rec)
+            self._rss = rec["rss_end_mb"]
+            self._peak = _peak_begin()
+        self._t = now
+
+    def close(self):
+        # lepas pelacak peak RSS lap terakhir (panggil setelah lap terakhir)
+        if self._peak is not None:
+            _peak_end(self._peak)
+            self._peak = None
+
+
+@contextmanager
+def maybe_stage(rec: Optional[StageRecorder], name: str, rows_in: Optional[int] = None, **extra):
+    # Helper untuk fungsi yang instrumentasinya opsional (rec=None -> tanpa catatan)
+    if rec is None:
+        yield {}
+        return
+    with rec.stage(name, rows_in=rows_in, **extra) as r:
+        yield r
+
+
+def read_jsonl(path: str = DEFAULT_LOG_PATH) -> pd.DataFrame:
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    return pd.read_json(path, lines=True)
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+# Executor di level modul: modul tidak di-reload saat Streamlit rerun,
+# jadi job tetap jalan walaupun script app.py dieksekusi ulang.
+_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="job")
+
+
+class Job:
+    """State satu job background yang aman dibaca dari thread UI."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.status = "pending"  # pending -> running -> done / error
+        self.stage = "Menunggu..."
+        self.progress = 0.0
+        self.stages: List[Dict[str, Any]] = []
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.traceback: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage: str, progress: Optional[float] = None):
+        with self._lock:
+            self.stage = stage
+            if progress is not None:
+                self.progress = max(self.progress, min(float(progress), 1.0))
+            self.stages.append({"stage": stage, "t": time.time()})
+
+    @property
+    def running(self) -> bool:
+        return self.status in ("pending", "running")
+
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return end - self.started_at
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": self.progress,
+                "stages": list(self.stages),
+                "error": self.error,
+                "elapsed": self.elapsed(),
+            }
+
+
+def start_job(name: str, fn: Callable[..., Any], *args, **kwargs) -> Job:
+    # fn dipanggil dengan argumen `job` agar bisa lapor progress per tahap
+    job = Job(name)
+
+    def _run():
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(*args, job=job, **kwargs)
+            job.set_stage("Selesai", 1.0)
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.traceback = traceback.format_exc()
+            job.status = "error"
+        finally:
+            job.finished_at = time.time()
+
+    _EXECUTOR.submit(_run)
+    return job
+
+
+def finished_job(name: str, result: Any, stage: str = "Selesai") -> Job:
+    # Job yang langsung selesai (mis. hasil diambil dari cache), dirender sama seperti job biasa
+    job = Job(name)
+    job.started_at = job.finished_at = time.time()
+    job.result = result
+    job.set_stage(stage, 1.0)
+    job.status = "done"
+    return job
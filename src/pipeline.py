@@ -0,0 +1,580 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.schema import CANON_COLS_28, normalize_and_validate_columns
+from src.cleaning import cast_numeric, make_indicator_inputs
+from src.indicators import compute_indicators
+from src.export import to_excel_bytes
+from src.sheets_client import (
+    UNFORMATTED,
+    ShardedTable,
+    build_sheets_service,
+    ensure_tab,
+    get_values,
+    shard_of,
+    write_values_chunked,
+)
+from src.sheets_payload import DEFAULT_DECIMALS, cast_sheet_numbers, df_to_values
+from src.history import SortedHistory
+from src.cold_store import ColdStore, read_last_trading_days
+from src.instrument import StageRecorder, count_cells, maybe_stage
+from src.bars import BAR_END_COL, BAR_INDICATORS, bar_lookback_days, compute_bar_indicators, period_start
+
+
+KEY_COLS = ["Tanggal Perdagangan Terakhir", "Kode Saham", "Nama Perusahaan"]
+KEY2 = ["Tanggal Perdagangan Terakhir", "Kode Saham"]
+
+KEEP_DAYS = 280
+
+
+OUT_A_INDICATORS = [
+    "SMA-5",
+    "OBV",
+    "TR",
+    "ATR-9",
+    "Gain Harian",
+    "Loss Harian",
+    "AvgGain-9",
+    "AvgLoss-9",
+    "RSI-9",
+    "Min Low-9",
+    "Max High-9",
+    "%K Stoch-9",
+    "%D Stoch-3",
+    "VWAP-5",
+    "MFM",
+    "CMF-9",
+    "MA-20",
+    "MA-50",
+    "Vol 20D Avg",
+    "4-Week High",
+]
+
+OUT_B_INDICATORS = [
+    "8-Week High",
+    "13-Week High",
+    "52-Week High",
+    "BB Middle",
+    "BB Upper",
+    "BB Lower",
+    "Std Dev 20D",
+    "EMA-5",
+    "EMA-12",
+    "MFI-14 (Money Flow Index)",
+    "ADL (Accumulation/Distribution Line)",
+    "VPT (Volume Price Trend)",
+    "Range Ratio (Daily Range / ATR)",
+    "Close Position % (0-100%)",
+    "Force Index (Raw)",
+    "Force Index EMA-13",
+    "Keltner Upper",
+    "Keltner Lower",
+    "EMA-20",
+]
+
+# tabel bar multi-timeframe (opsional, aktif kalau spreadsheet id-nya diisi)
+BAR_TABLES = {"W": "OUTPUT_W", "M": "OUTPUT_M"}
+
+INDICATOR_COLS = OUT_A_INDICATORS + OUT_B_INDICATORS + BAR_INDICATORS
+
+
+def _read_sheet_as_df(service, spreadsheet_id: str, sheet_name: str, rec=None) -> pd.DataFrame:
+    with maybe_stage(rec, f"sheets.get {sheet_name}") as m:
+        values = get_values(service, spreadsheet_id, f"{sheet_name}!A1:ZZ", UNFORMATTED)
+        m["cells_in"] = count_cells(values)
+        m["rows_out"] = max(len(values) - 1, 0)
+    return _values_to_df(values)
+
+
+def _values_to_df(values) -> pd.DataFrame:
+    if not values:
+        return pd.DataFrame()
+
+    header = values[0]
+    rows = values[1:]
+    if not rows:
+        return pd.DataFrame(columns=header)
+
+    width = len(header)
+    norm_rows = [(r + [""] * (width - len(r)))[:width] for r in rows]
+    return pd.DataFrame(norm_rows, columns=header)
+
+
+class SheetsWriteOptions:
+    """Format payload tulis: pembulatan kolom indikator + batas ukuran body request."""
+
+    def __init__(self, decimals: Optional[int] = DEFAULT_DECIMALS, max_request_bytes: Optional[int] = None):
+        self.decimals = decimals
+        self.max_request_bytes = max_request_bytes
+
+
+def _df_to_values(df: pd.DataFrame, opts: Optional[SheetsWriteOptions] = None):
+    opts = opts or SheetsWriteOptions()
+    return df_to_values(df, decimals=opts.decimals, round_cols=INDICATOR_COLS)
+
+
+def _write_df(service, spreadsheet_id: str, sheet_name: str, df: pd.DataFrame, rec=None, opts: Optional[SheetsWriteOptions] = None):
+    opts = opts or SheetsWriteOptions()
+    with maybe_stage(rec, f"_df_to_values {sheet_name}", rows_in=len(df)) as m:
+        values = _df_to_values(df, opts)
+        m["cells_out"] = count_cells(values)
+    with maybe_stage(rec, f"sheets.update {sheet_name}", rows_in=len(df)) as m:
+        write_values_chunked(service, spreadsheet_id, sheet_name, values, opts.max_request_bytes)
+        m["cells_out"] = count_cells(values)
+
+
+def _load_history(existing: pd.DataFrame, sheet_name: str, rec=None) -> SortedHistory:
+    # Sheets mengembalikan teks: cast ke angka sekali di sini, supaya upsert dan
+    # serialisasi tulis berikutnya bekerja di kolom float (bukan parse ulang teks)
+    with maybe_stage(rec, f"cast_sheet_numbers {sheet_name}", rows_in=len(existing)) as m:
+        existing = cast_sheet_numbers(existing)
+        m["rows_out"] = len(existing)
+    # satu-satunya parse tanggal + sort untuk data lama; sort dilewati bila sheet sudah urut
+    with maybe_stage(rec, f"SortedHistory.from_frame {sheet_name}", rows_in=len(existing)) as m:
+        hist = SortedHistory.from_frame(existing)
+        m["rows_out"] = len(hist)
+    return hist
+
+
+def _timed_upsert(hist: SortedHistory, incoming: pd.DataFrame, sheet_name: str, rec=None) -> SortedHistory:
+    with maybe_stage(rec, f"SortedHistory.upsert {sheet_name}", rows_in=len(hist) + len(incoming)) as m:
+        out = hist.upsert(incoming)
+        m["rows_out"] = len(out)
+    return out
+
+
+def _timed_prune(hist: SortedHistory, sheet_name: str, rec=None, cold: Optional[ColdStore] = None) -> SortedHistory:
+    # prune 280 hari = slice partisi tanggal (yang keluar dipindah ke cold store)
+    with maybe_stage(rec, f"keep_last_trading_days {sheet_name}", rows_in=len(hist)) as m:
+        hist, expired = hist.keep_last(KEEP_DAYS)
+        m["rows_out"] = len(hist)
+    if cold is not None and not expired.empty:
+        with maybe_stage(rec, f"cold_store.archive {sheet_name}", rows_in=len(expired)) as m:
+            m["rows_out"] = cold.archive(expired)
+    return hist
+
+
+def _open_sharded(service, sa_info: dict, spreadsheet_id: str, table: str, pool_ids=None) -> ShardedTable:
+    return ShardedTable(
+        service,
+        spreadsheet_id,
+        table,
+        pool_ids=pool_ids,
+        make_service=lambda: build_sheets_service(sa_info),
+    ).load_manifest()
+
+
+def _read_shards_df(st_table: ShardedTable, shards, rec=None) -> pd.DataFrame:
+    # header dibaca per shard, jadi shard lama dengan kolom berbeda tetap sejajar
+    with maybe_stage(rec, f"shards.get {st_table.table}") as m:
+        parts = st_table.read_shards(shards)
+        m["cells_in"] = sum(count_cells(v) for v in parts)
+        m["shards"] = len(shards)
+    frames = [_values_to_df(v) for v in parts if v]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_table_df(service, sa_info: dict, spreadsheet_id: str, table: str, start=None, end=None) -> pd.DataFrame:
+    """Baris satu tabel logis di [start, end]; tabel ber-shard hanya baca shard yang overlap."""
+    start_s = str(start) if start is not None else None
+    end_s = str(end) if end is not None else None
+    st_table = _open_sharded(service, sa_info, spreadsheet_id, table)
+    if st_table.sharded:
+        df = _read_shards_df(st_table, st_table.shards_overlapping(start_s, end_s))
+    else:
+        df = _read_sheet_as_df(service, spreadsheet_id, table)
+    if df.empty or (start_s is None and end_s is None):
+        return df
+    # tanggal tersimpan sebagai string YYYY-MM-DD, jadi cukup compare string
+    dates = df["Tanggal Perdagangan Terakhir"].astype(str)
+    keep = pd.Series(True, index=df.index)
+    if start_s is not None:
+        keep &= dates >= start_s
+    if end_s is not None:
+        keep &= dates <= end_s
+    return df[keep].reset_index(drop=True)
+
+
+def _sync_sharded(
+    service,
+    st_table: ShardedTable,
+    incoming: pd.DataFrame,
+    rec=None,
+    cold: Optional[ColdStore] = None,
+    read_all: bool = True,
+    keep_from: Optional[str] = None,
+    opts: Optional[SheetsWriteOptions] = None,
+) -> SortedHistory:
+    """read -> upsert -> retensi -> write untuk tabel ber-shard; hanya shard bulan yang tersentuh."""
+    table = st_table.table
+    inc = SortedHistory.from_frame(incoming)
+    inc_months = set(inc.month_slices())
+
+    # tabel tanpa manifest dimigrasi dari tab tunggal; tab lama dihapus setelah manifest tersimpan
+    migrating = not st_table.sharded
+    if migrating and not st_table.has_pool:
+        raise ValueError(
+            f"Sharding {table} butuh SHARD_SPREADSHEET_IDS[{table!r}] (spreadsheet lain); "
+            "shard di spreadsheet yang sama tidak menambah batas sel."
+        )
+    if migrating:
+        existing = pd.DataFrame()
+        if st_table.has_tab(st_table.home_id, table):
+            existing = _read_sheet_as_df(service, st_table.home_id, table, rec=rec)
+    else:
+        if read_all:
+            shards = st_table.shards_overlapping()
+        else:
+            shards = [s for s in st_table.shards_overlapping() if s in inc_months]
+            if keep_from is not None:
+                # shard yang perlu dipangkas; shard yang seluruhnya expired cukup dibaca bila diarsip
+                for s in st_table.shards_overlapping(end=keep_from):
+                    if s not in shards and (st_table.entries[s]["end_date"] >= keep_from or cold is not None):
+                        shards.append(s)
+        existing = _read_shards_df(st_table, sorted(shards), rec=rec)
+
+    hist = _load_history(existing, table, rec=rec)
+    with maybe_stage(rec, f"SortedHistory.upsert {table}", rows_in=len(hist) + len(inc)) as m:
+        hist = hist.merge(inc)
+        m["rows_out"] = len(hist)
+
+    with maybe_stage(rec, f"keep_last_trading_days {table}", rows_in=len(hist)) as m:
+        if keep_from is None:
+            hot, expired = hist.keep_last(KEEP_DAYS)
+        else:
+            hot, expired = hist.split_before(keep_from)
+        m["rows_out"] = len(hot)
+    if cold is not None and not expired.empty:
+        with maybe_stage(rec, f"cold_store.archive {table}", rows_in=len(expired)) as m:
+            m["rows_out"] = cold.archive(expired)
+
+    hot_months = hot.month_slices()
+    # shard yang seluruhnya sebelum cutoff dibuang (termasuk yang tidak dibaca)
+    cutoff = keep_from if keep_from is not None else hot.first_date()
+    if migrating:
+        dirty = set(hot_months)
+    else:
+        dirty = inc_months | {shard_of(d) for d in pd.unique(expired["Tanggal Perdagangan Terakhir"])}
+
+    with maybe_stage(rec, f"shards.update {table}", rows_in=len(hot)) as m:
+        cells = 0
+        written = 0
+        for month in sorted(dirty):
+            if month not in hot_months:
+                st_table.drop_shard(month)
+                continue
+            a, b = hot_months[month]
+            part = hot.frame.iloc[a:b]
+            values = _df_to_values(part, opts)
+            st_table.write_shard(
+                month,
+                values,
+                start_date=part["Tanggal Perdagangan Terakhir"].iloc[0],
+                end_date=part["Tanggal Perdagangan Terakhir"].iloc[-1],
+                max_bytes=opts.max_request_bytes if opts else None,
+            )
+            cells += count_cells(values)
+            written += 1
+        if cutoff is not None:
+            for month, e in list(st_table.entries.items()):
+                if e["end_date"] < cutoff:
+                    st_table.drop_shard(month)
+        st_table.save_manifest()
+        m["cells_out"] = cells
+        m["shards"] = written
+
+    if migrating:
+        # home sekarang punya tab _MANIFEST, jadi tab lama selalu bisa dihapus
+        st_table.delete_tab(st_table.home_id, table)
+    return hot
+
+
+def _sort_date_emiten(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.copy()
+    out["Tanggal Perdagangan Terakhir"] = pd.to_datetime(out["Tanggal Perdagangan Terakhir"], errors="coerce")
+    out = out.sort_values(["Tanggal Perdagangan Terakhir", "Kode Saham"], kind="mergesort")
+    out["Tanggal Perdagangan Terakhir"] = out["Tanggal Perdagangan Terakhir"].dt.date.astype(str)
+    return out
+
+
+def merge_db_tables(raw_db: pd.DataFrame, out_a_db: pd.DataFrame, out_b_db: pd.DataFrame) -> pd.DataFrame:
+    """Gabungkan RAW + OUTPUT_A + OUTPUT_B by (tanggal, emiten); RAW source-of-truth tanggal."""
+    def _norm_dates(df: pd.DataFrame) -> pd.DataFrame:
+        out = df.copy()
+        d = pd.to_datetime(out["Tanggal Perdagangan Terakhir"], errors="coerce")
+        out = out.loc[d.notna()].copy()
+        out["Tanggal Perdagangan Terakhir"] = d[d.notna()].dt.date.astype(str)
+        return out
+
+    raw = _norm_dates(raw_db.reindex(columns=CANON_COLS_28))
+
+    # Pastikan schema OUTPUT_A/B sesuai header source-of-truth
+    out_a = _norm_dates(out_a_db.reindex(columns=KEY_COLS + OUT_A_INDICATORS))
+    out_b = _norm_dates(out_b_db.reindex(columns=KEY_COLS + OUT_B_INDICATORS))
+
+    # Robust: jangan join pakai Nama Perusahaan (ambil dari RAW saja)
+    out_a = out_a.drop(columns=["Nama Perusahaan"], errors="ignore")
+    out_b = out_b.drop(columns=["Nama Perusahaan"], errors="ignore")
+
+    # (Opsional safety) hilangkan duplikat key kalau ada edit manual di Sheets
+    raw = raw.drop_duplicates(subset=KEY2, keep="last")
+    out_a = out_a.drop_duplicates(subset=KEY2, keep="last")
+    out_b = out_b.drop_duplicates(subset=KEY2, keep="last")
+
+    merged = raw.merge(out_a, how="left", on=KEY2).merge(out_b, how="left", on=KEY2)
+    return _sort_date_emiten(merged)
+
+
+def _report(job, stage: str, progress: float):
+    if job is not None:
+        job.set_stage(stage, progress)
+
+
+def _upsert_output_sheet(
+    sa_info: dict,
+    spreadsheet_id: str,
+    sheet_name: str,
+    incoming: pd.DataFrame,
+    job=None,
+    progress_base: float = 0.0,
+    rec=None,
+    cold: Optional[ColdStore] = None,
+    sharding: bool = False,
+    pool_ids=None,
+    keep_from: Optional[str] = None,
+    opts: Optional[SheetsWriteOptions] = None,
+    create_tab: bool = False,
+) -> int:
+    # Satu siklus read -> upsert -> prune -> write untuk satu sheet output.
+    # Service dibuat per thread karena client httplib2 tidak thread-safe.
+    service = build_sheets_service(sa_info)
+
+    st_table = _open_sharded(service, sa_info, spreadsheet_id, sheet_name, pool_ids)
+    if st_table.sharded or (sharding and st_table.has_pool):
+        _report(job, f"{sheet_name}: sync shard", progress_base)
+        # tanpa keep_from (tabel bar) retensi butuh seluruh shard
+        hist = _sync_sharded(
+            service, st_table, incoming, rec=rec, cold=cold, read_all=keep_from is None, keep_from=keep_from, opts=opts
+        )
+        # hist hanya memuat shard yang dibaca; total baris diambil dari manifest
+        return st_table.total_rows
+
+    _report(job, f"{sheet_name}: baca sheet", progress_base)
+    if create_tab and not st_table.has_tab(spreadsheet_id, sheet_name):
+        # tab tabel bar dibuat otomatis saat pertama kali dipakai
+        ensure_tab(service, spreadsheet_id, sheet_name)
+    existing = _read_sheet_as_df(service, spreadsheet_id, sheet_name, rec=rec)
+
+    _report(job, f"{sheet_name}: upsert + retensi", progress_base + 0.05)
+    hist = _load_history(existing, sheet_name, rec=rec)
+    hist = _timed_upsert(hist, incoming, sheet_name, rec=rec)
+    hist = _timed_prune(hist, sheet_name, rec=rec, cold=cold)
+
+    _report(job, f"{sheet_name}: tulis sheet", progress_base + 0.1)
+    _write_df(service, spreadsheet_id, sheet_name, hist.frame, rec=rec, opts=opts)
+    return len(hist)
+
+
+def run_process(
+    sa_info: dict,
+    spreadsheet_ids: Dict[str, str],
+    validated_df: pd.DataFrame,
+    job=None,
+    metrics_log_path: Optional[str] = None,
+    cold_dir: Optional[str] = None,
+    indicator_lookback_days: int = KEEP_DAYS,
+    sharding: bool = False,
+    shard_pools: Optional[Dict[str, List[str]]] = None,
+    write_options: Optional[SheetsWriteOptions] = None,
+) -> Dict[str, Any]:
+    """Pipeline Process: upsert RAW, hitung indikator, upsert OUTPUT_A/B (+ bar W/M), buat file download."""
+    rec = StageRecorder(label="process")
+    try:
+        return _run_process(
+            sa_info, spreadsheet_ids, validated_df, job, rec, cold_dir, indicator_lookback_days, sharding,
+            shard_pools or {}, write_options or SheetsWriteOptions(),
+        )
+    finally:
+        if metrics_log_path:
+            rec.write_jsonl(metrics_log_path)
+
+
+def _run_process(
+    sa_info, spreadsheet_ids, validated_df, job, rec: StageRecorder, cold_dir, indicator_lookback_days, sharding, shard_pools,
+    write_options: SheetsWriteOptions,
+) -> Dict[str, Any]:
+    raw_id = spreadsheet_ids["RAW"]
+    out_a_id = spreadsheet_ids["OUTPUT_A"]
+    out_b_id = spreadsheet_ids["OUTPUT_B"]
+    bar_tables = {tf: t for tf, t in BAR_TABLES.items() if spreadsheet_ids.get(t)}
+
+    cold = {}
+    if cold_dir:
+        cold = {t: ColdStore(cold_dir, t) for t in ("RAW", "OUTPUT_A", "OUTPUT_B")}
+        # tabel bar punya kolom tanggal kedua yang harus tetap teks di arsip
+        cold.update({t: ColdStore(cold_dir, t, date_cols=[BAR_END_COL]) for t in bar_tables.values()})
+
+    service = build_sheets_service(sa_info)
+
+    df_today_raw = validated_df.copy()
+    df_today_raw["Tanggal Perdagangan Terakhir"] = df_today_raw["Tanggal Perdagangan Terakhir"].astype(str)
+
+    # --- RAW: read existing -> upsert -> write back
+    raw_table = _open_sharded(service, sa_info, raw_id, "RAW", shard_pools.get("RAW"))
+    if raw_table.sharded or (sharding and raw_table.has_pool):
+        _report(job, "RAW: sync shard", 0.05)
+        raw_hist = _sync_sharded(
+            service, raw_table, df_today_raw[CANON_COLS_28], rec=rec, cold=cold.get("RAW"), opts=write_options
+        )
+    else:
+        _report(job, "RAW: baca sheet", 0.05)
+        existing_raw = _read_sheet_as_df(service, raw_id, "RAW", rec=rec)
+
+        _report(job, "RAW: upsert + retensi", 0.15)
+        raw_hist = _load_history(existing_raw, "RAW", rec=rec)
+        raw_hist = _timed_upsert(raw_hist, df_today_raw[CANON_COLS_28], "RAW", rec=rec)
+        raw_hist = _timed_prune(raw_hist, "RAW", rec=rec, cold=cold.get("RAW"))
+
+        _report(job, "RAW: tulis sheet", 0.25)
+        _write_df(service, raw_id, "RAW", raw_hist.frame, rec=rec, opts=write_options)
+    raw_merged = raw_hist.frame
+
+    # --- Build historis untuk indikator dari RAW (pakai yang sudah tersimpan)
+    _report(job, "Hitung indikator", 0.35)
+    with rec.stage("read_last_trading_days RAW", rows_in=len(raw_hist)) as m:
+        ind_hist = read_last_trading_days(raw_hist, cold.get("RAW"), indicator_lookback_days)
+        m["rows_out"] = len(ind_hist)
+
+    # urutan (emiten, tanggal) dari permutasi SortedHistory; tanggal tidak di-parse ulang
+    with rec.stage("cast_numeric RAW", rows_in=len(ind_hist)) as m:
+        raw_for_ind = normalize_and_validate_columns(ind_hist.by_ticker())
+        raw_for_ind = cast_numeric(raw_for_ind)
+        m["rows_out"] = len(raw_for_ind)
+
+    # buat input indikator: price 0 -> NaN
+    raw_for_ind = make_indicator_inputs(raw_for_ind)
+
+    # hitung indikator (per emiten, urutan tanggal dijaga di engine)
+    with rec.stage("compute_indicators", rows_in=len(raw_for_ind)) as m:
+        df_ind = compute_indicators(raw_for_ind, rec=rec, presorted=True)
+        m["rows_out"] = len(df_ind)
+
+    # ambil tanggal hari ini saja (sesuai file input)
+    today_dates = pd.to_datetime(validated_df["Tanggal Perdagangan Terakhir"]).dt.date.unique()
+
+    # bar mingguan/bulanan dari histori harian urut (emiten, tanggal) sepanjang
+    # bar_lookback_days per timeframe (hot + cold); kalau hasilnya sama dengan window
+    # indikator harian, array harian yang sudah ada dipakai ulang.
+    # hanya bar periode yang memuat tanggal upload yang di-upsert
+    bars_today = {}
+    bar_history = {}
+    for tf, table in bar_tables.items():
+        n_days = max(bar_lookback_days(tf), indicator_lookback_days)
+        with rec.stage(f"read_last_trading_days {table}", rows_in=len(raw_hist)) as m:
+            bar_hist = read_last_trading_days(raw_hist, cold.get("RAW"), n_days)
+            m["rows_out"] = len(bar_hist)
+        # histori kurang -> indikator rekursif bar masih kosong; dilaporkan ke UI
+        bar_history[table] = {"days": bar_hist.n_dates, "needed": bar_lookback_days(tf)}
+        bar_input = raw_for_ind
+        if bar_hist.n_dates != ind_hist.n_dates:
+            with rec.stage(f"cast_numeric {table}", rows_in=len(bar_hist)) as m:
+                bar_input = make_indicator_inputs(cast_numeric(normalize_and_validate_columns(bar_hist.by_ticker())))
+                m["rows_out"] = len(bar_input)
+        with rec.stage(f"compute_bar_indicators {table}", rows_in=len(bar_input)) as m:
+            bars = compute_bar_indicators(bar_input, tf)
+            periods = np.datetime_as_string(period_start(np.array(today_dates, dtype="datetime64[D]"), tf), unit="D")
+            bars_today[table] = bars[bars["Tanggal Perdagangan Terakhir"].isin(set(periods))].reset_index(drop=True)
+            m["rows_out"] = len(bars_today[table])
+    df_ind["Tanggal Perdagangan Terakhir"] = pd.to_datetime(df_ind["Tanggal Perdagangan Terakhir"]).dt.date
+    df_today_ind = df_ind[df_ind["Tanggal Perdagangan Terakhir"].isin(today_dates)].copy()
+
+    # persiapan OUTPUT A/B
+    out_a_cols = KEY_COLS + OUT_A_INDICATORS
+    out_b_cols = KEY_COLS + OUT_B_INDICATORS
+
+    # key harus selalu dari input hari ini (agar output tidak kosong)
+    df_today_key = validated_df[KEY_COLS].copy()
+    df_today_key["Tanggal Perdagangan Terakhir"] = df_today_key["Tanggal Perdagangan Terakhir"].astype(str)
+
+    # indikator hari ini (keyed)
+    df_today_ind2 = df_today_ind.copy()
+    df_today_ind2["Tanggal Perdagangan Terakhir"] = pd.to_datetime(df_today_ind2["Tanggal Perdagangan Terakhir"]).dt.date.astype(str)
+
+    ind_a = df_today_ind2.reindex(columns=KEY2 + OUT_A_INDICATORS)
+    ind_b = df_today_ind2.reindex(columns=KEY2 + OUT_B_INDICATORS)
+
+    # urut tanggal lalu emiten dijamin saat upsert ke SortedHistory
+    out_a = df_today_key.merge(ind_a, how="left", on=KEY2).reindex(columns=out_a_cols)
+    out_b = df_today_key.merge(ind_b, how="left", on=KEY2).reindex(columns=out_b_cols)
+
+    # --- OUTPUT_A, OUTPUT_B (dan tabel bar) independen: siklus read-upsert-write paralel
+    _report(job, "OUTPUT_A + OUTPUT_B: upsert paralel", 0.5)
+    with ThreadPoolExecutor(max_workers=2 + len(bars_today), thread_name_prefix="upsert") as pool:
+        # tabel ber-shard ikut awal hot window RAW, jadi cukup baca shard yang tersentuh
+        keep_from = raw_hist.first_date()
+        fut_a = pool.submit(
+            _upsert_output_sheet, sa_info, out_a_id, "OUTPUT_A", out_a, job, 0.5, rec,
+            cold.get("OUTPUT_A"), sharding, shard_pools.get("OUTPUT_A"), keep_from, write_options,
+        )
+        fut_b = pool.submit(
+            _upsert_output_sheet, sa_info, out_b_id, "OUTPUT_B", out_b, job, 0.5, rec,
+            cold.get("OUTPUT_B"), sharding, shard_pools.get("OUTPUT_B"), keep_from, write_options,
+        )
+        # tabel bar: retensi KEEP_DAYS periode (bukan ikut hot window harian)
+        fut_bars = {
+            table: pool.submit(
+                _upsert_output_sheet, sa_info, spreadsheet_ids[table], table, incoming, job, 0.5, rec,
+                cold.get(table), sharding, shard_pools.get(table), None, write_options, True,
+            )
+            for table, incoming in bars_today.items()
+        }
+        rows_a = fut_a.result()
+        rows_b = fut_b.result()
+        bar_rows = {table: fut.result() for table, fut in fut_bars.items()}
+
+    # --- generate 1 file excel download: 28 kolom input + semua indikator untuk hari ini
+    _report(job, "Buat file Excel", 0.85)
+    df_today_input = validated_df.copy()
+    df_today_input["Tanggal Perdagangan Terakhir"] = df_today_input["Tanggal Perdagangan Terakhir"].astype(str)
+
+    # build indikator table dengan key, lalu merge by key (bukan concat)
+    ind_cols = KEY2 + OUT_A_INDICATORS + OUT_B_INDICATORS
+    ind_table = df_today_ind2.reindex(columns=ind_cols).copy()
+
+    out_download = df_today_input[CANON_COLS_28].merge(
+        ind_table,
+        how="left",
+        on=KEY2,
+    )
+
+    # final sort: tanggal, emiten
+    out_download = _sort_date_emiten(out_download)
+
+    with rec.stage("to_excel_bytes", rows_in=len(out_download)) as m:
+        xbytes = to_excel_bytes(out_download, sheet_name="OUTPUT")
+        m["rows_out"] = len(out_download)
+        m["bytes_out"] = len(xbytes)
+
+    # Ambil tanggal dari file upload (ambil yang paling baru)
+    dmax = pd.to_datetime(validated_df["Tanggal Perdagangan Terakhir"]).max()
+    ddmmyy = pd.to_datetime(dmax).strftime("%d%m%y")
+
+    return {
+        "xbytes": xbytes,
+        "file_name": f"RekapSahamIndikator-{ddmmyy}.xlsx",
+        "raw_rows": len(raw_merged),
+        "out_a_rows": rows_a,
+        "out_b_rows": rows_b,
+        "bar_rows": bar_rows,
+        "bar_history": bar_history,
+        "raw_last_dates": pd.Series(raw_merged["Tanggal Perdagangan Terakhir"].unique()).tail(15).tolist(),
+        "metrics": rec.to_frame(),
+    }
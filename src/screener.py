@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import operator
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+DATE_COL = "Tanggal Perdagangan Terakhir"
+TICKER_COL = "Kode Saham"
+TEXT_COLS = ("Nama Perusahaan", "Remarks")
+
+# Kolom turunan yang sering dipakai untuk screening
+CLOSE_VS_52WH = "Close vs 52W High %"
+VOL_RATIO_20D = "Vol / Vol 20D Avg"
+
+OPS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+}
+
+Condition = Tuple[str, str, float]
+
+
+def add_derived_columns(df: pd.DataFrame) -> pd.DataFrame:
+    # Nilai dari Sheets bisa berupa teks, jadi cast numerik dulu
+    out = df.copy()
+    num = {c: pd.to_numeric(out[c], errors="coerce") for c in ("Penutupan", "52-Week High", "Volume", "Vol 20D Avg")}
+    out[CLOSE_VS_52WH] = (num["Penutupan"] / num["52-Week High"] - 1) * 100
+    out[VOL_RATIO_20D] = num["Volume"] / num["Vol 20D Avg"]
+    for c in (CLOSE_VS_52WH, VOL_RATIO_20D):
+        out[c] = out[c].replace([np.inf, -np.inf], np.nan)
+    return out
+
+
+class ScreenerIndex:
+    """Array kolom per tanggal + permutasi sort per tanggal, jadi filter cukup ``searchsorted``."""
+
+    def __init__(self, df: pd.DataFrame, columns: Optional[Sequence[str]] = None):
+        d = pd.to_datetime(df[DATE_COL], errors="coerce")
+        keep = d.notna().to_numpy()
+        df = df.loc[keep]
+        d = d[keep]
+
+        date_codes, dates = pd.factorize(d, sort=True)
+        tickers = df[TICKER_COL].astype(str).to_numpy()
+        order = np.lexsort((tickers, date_codes))
+
+        self.dates = pd.DatetimeIndex(dates).date
+        self.date_codes = date_codes[order]
+        self.tickers = tickers[order]
+        self.date_offsets = np.searchsorted(self.date_codes, np.arange(len(self.dates) + 1))
+
+        if columns is None:
+            columns = [c for c in df.columns if c not in (DATE_COL, TICKER_COL) + TEXT_COLS]
+        self.available = list(columns)
+        self._source = {c: df[c] for c in columns}
+        self._order = order
+
+        self.text_columns: Dict[str, np.ndarray] = {
+            c: df[c].astype(str).to_numpy()[order] for c in TEXT_COLS if c in df.columns
+        }
+
+        # per kolom (dibangun saat pertama dipakai, lalu di-cache):
+        # array nilai, posisi global terurut (tanggal, nilai), nilai terurut, rank
+        self.columns: Dict[str, np.ndarray] = {}
+        self._sorted_pos: Dict[str, np.ndarray] = {}
+        self._sorted_val: Dict[str, np.ndarray] = {}
+        self._rank: Dict[str, np.ndarray] = {}
+
+    def build(self, columns: Iterable[str]) -> "ScreenerIndex":
+        """Siapkan array + urutan sort untuk kolom-kolom ini sekarang (bukan saat query)."""
+        for c in columns:
+            self._ensure(c)
+        return self
+
+    def _ensure(self, c: str):
+        if c in self.columns:
+            return
+        if c not in self._source:
+            raise KeyError(f"Kolom tidak bisa di-screen: {c}")
+        v = pd.to_numeric(self._source.pop(c), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)[self._order]
+        pos = np.lexsort((v, self.date_codes))
+        rank = np.empty(len(pos), dtype=np.int64)
+        rank[pos] = np.arange(len(pos))
+        self.columns[c] = v
+        self._sorted_pos[c] = pos
+        self._sorted_val[c] = v[pos]
+        self._rank[c] = rank
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    @property
+    def latest_date(self):
+        return self.dates[-1] if len(self.dates) else None
+
+    def date_index(self, date) -> int:
+        i = int(np.searchsorted(self.dates, pd.Timestamp(date).date()))
+        if i >= len(self.dates) or self.dates[i] != pd.Timestamp(date).date():
+            raise KeyError(f"Tanggal tidak ada di index: {date}")
+        return i
+
+    def _candidates(self, di: int, cond: Condition) -> np.ndarray:
+        # Posisi global yang memenuhi cond pada tanggal di, via searchsorted
+        col, op, value = cond
+        lo, hi = self.date_offsets[di], self.date_offsets[di + 1]
+        vals = self._sorted_val[col][lo:hi]
+        n_valid = hi - lo - int(np.isnan(vals).sum())
+        vals = vals[:n_valid]
+        if op == "<":
+            a, b = 0, np.searchsorted(vals, value, side="left")
+        elif op == "<=":
+            a, b = 0, np.searchsorted(vals, value, side="right")
+        elif op == ">":
+            a, b = np.searchsorted(vals, value, side="right"), n_valid
+        elif op == ">=":
+            a, b = np.searchsorted(vals, value, side="left"), n_valid
+        elif op == "==":
+            a = np.searchsorted(vals, value, side="left")
+            b = np.searchsorted(vals, value, side="right")
+        else:
+            raise ValueError(f"Operator tidak dikenal: {op}")
+        return self._sorted_pos[col][lo + a:lo + b]
+
+    def _check(self, conditions: Iterable[Condition]):
+        for col, op, _ in conditions:
+            if op not in OPS:
+                raise ValueError(f"Operator tidak dikenal: {op}")
+            self._ensure(col)
+
+    def screen_positions(
+        self,
+        conditions: List[Condition],
+        date_indices: Sequence[int],
+        sort_by: Optional[str] = None,
+        ascending: bool = False,
+        top: Optional[int] = None,
+    ) -> np.ndarray:
+        """Posisi baris yang lolos semua kondisi, urut per tanggal lalu ``sort_by``."""
+        self._check(conditions)
+        if sort_by is not None:
+            self._ensure(sort_by)
+
+        out = []
+        for di in date_indices:
+            lo, hi = self.date_offsets[di], self.date_offsets[di + 1]
+            if conditions:
+                # kandidat tiap kondisi via index (slice, tanpa scan); mulai dari
+                # yang paling selektif, sisanya dicek langsung di kandidat
+                cands = [self._candidates(di, c) for c in conditions]
+                best = int(np.argmin([len(c) for c in cands]))
+                pos = cands[best]
+                for i, (col, op, value) in enumerate(conditions):
+                    if i != best:
+                        pos = pos[OPS[op](self.columns[col][pos], value)]
+            else:
+                pos = np.arange(lo, hi)
+
+            if sort_by is not None:
+                # rank sudah dihitung sekali; NaN selalu di akhir
+                r = self._rank[sort_by][pos]
+                v = self.columns[sort_by][pos]
+                if ascending:
+                    pos = pos[np.argsort(r, kind="stable")]
+                else:
+                    nan = np.isnan(v)
+                    pos = np.concatenate([pos[~nan][np.argsort(-r[~nan], kind="stable")], pos[nan]])
+            else:
+                pos = np.sort(pos)
+
+            if top is not None:
+                pos = pos[:top]
+            out.append(pos)
+
+        if not out:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(out)
+
+    def screen(
+        self,
+        conditions: List[Condition],
+        dates: Optional[Sequence] = None,
+        sort_by: Optional[str] = None,
+        ascending: bool = False,
+        top: Optional[int] = None,
+        columns: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
+        """Jalankan screen di satu atau banyak tanggal (default: tanggal terakhir)."""
+        if dates is None:
+            date_indices = [len(self.dates) - 1] if len(self.dates) else []
+        else:
+            date_indices = sorted({self.date_index(d) for d in dates})
+
+        pos = self.screen_positions(conditions, date_indices, sort_by=sort_by, ascending=ascending, top=top)
+        return self.frame(pos, columns=columns)
+
+    def frame(self, pos: np.ndarray, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        if columns is None:
+            columns = list(self.text_columns) + self.available
+        for c in columns:
+            if c not in self.text_columns:
+                self._ensure(c)
+        data = {
+            DATE_COL: pd.Series(self.dates[self.date_codes[pos]]).astype(str).to_numpy(),
+            TICKER_COL: self.tickers[pos],
+        }
+        for c in columns:
+            if c in self.columns:
+                data[c] = self.columns[c][pos]
+            elif c in self.text_columns:
+                data[c] = self.text_columns[c][pos]
+        return pd.DataFrame(data)
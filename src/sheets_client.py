@@ -1,6 +1,11 @@
 from __future__ import annotations
 
-from typing import List, Dict, Any, Optional
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
 
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
@@ -14,10 +19,16 @@ def build_sheets_service(service_account_info: dict):
     return build("sheets", "v4", credentials=creds)
 
 
-def get_values(service, spreadsheet_id: str, a1_range: str) -> List[List[Any]]:
+# angka dikirim sebagai angka JSON (bukan teks terformat), jadi tidak perlu di-parse ulang
+UNFORMATTED = "UNFORMATTED_VALUE"
+
+
+def get_values(service, spreadsheet_id: str, a1_range: str, value_render_option: Optional[str] = None) -> List[List[Any]]:
+    kwargs = {"valueRenderOption": value_render_option} if value_render_option else {}
     resp = service.spreadsheets().values().get(
         spreadsheetId=spreadsheet_id,
-        range=a1_range
+        range=a1_range,
+        **kwargs
     ).execute()
     return resp.get("values", [])
 
@@ -32,9 +43,233 @@ def write_values(service, spreadsheet_id: str, a1_range: str, values: List[List[
     ).execute()
 
 
+def split_values(values: List[List[Any]], max_bytes: Optional[int]) -> List[List[List[Any]]]:
+    # Potong baris jadi beberapa body request dengan ukuran JSON <= max_bytes (perkiraan
+    # dari sampel baris, bukan serialisasi penuh dua kali). None = satu request.
+    if not max_bytes or len(values) <= 1:
+        return [values]
+    step = max(len(values) // 50, 1)
+    sample = values[::step]
+    avg = len(json.dumps(sample, ensure_ascii=False)) / len(sample)
+    rows_per_chunk = max(int(max_bytes // max(avg, 1.0)), 1)
+    return [values[i:i + rows_per_chunk] for i in range(0, len(values), rows_per_chunk)]
+
+
+def write_values_chunked(service, spreadsheet_id: str, sheet_name: str, values: List[List[Any]], max_bytes: Optional[int] = None):
+    """Tulis mulai A1, dipecah per body request (lihat ``split_values``)."""
+    row = 1
+    for chunk in split_values(values, max_bytes):
+        write_values(service, spreadsheet_id, f"{sheet_name}!A{row}", chunk)
+        row += len(chunk)
+
+
 def batch_update(service, spreadsheet_id: str, requests: List[Dict[str, Any]]):
     body = {"requests": requests}
     service.spreadsheets().batchUpdate(
         spreadsheetId=spreadsheet_id,
         body=body
     ).execute()
+
+
+def list_tabs(service, spreadsheet_id: str) -> Dict[str, int]:
+    resp = service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id,
+        fields="sheets.properties(title,sheetId)"
+    ).execute()
+    return {s["properties"]["title"]: s["properties"]["sheetId"] for s in resp.get("sheets", [])}
+
+
+def ensure_tab(service, spreadsheet_id: str, title: str):
+    if title not in list_tabs(service, spreadsheet_id):
+        batch_update(service, spreadsheet_id, [{"addSheet": {"properties": {"title": title}}}])
+
+
+def clear_values(service, spreadsheet_id: str, a1_range: str):
+    service.spreadsheets().values().clear(
+        spreadsheetId=spreadsheet_id,
+        range=a1_range,
+        body={}
+    ).execute()
+
+
+def read_ranges_parallel(
+    make_service, ranges: List[Tuple[str, str]], max_workers: int = 4, value_render_option: Optional[str] = None
+) -> List[List[List[Any]]]:
+    # ranges: [(spreadsheet_id, a1_range)], hasil sesuai urutan input.
+    # Satu service per worker thread karena client httplib2 tidak thread-safe.
+    local = threading.local()
+
+    def _get(item):
+        if getattr(local, "service", None) is None:
+            local.service = make_service()
+        return get_values(local.service, item[0], item[1], value_render_option)
+
+    if len(ranges) <= 1:
+        return [_get(r) for r in ranges]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(ranges)), thread_name_prefix="shard") as pool:
+        return list(pool.map(_get, ranges))
+
+
+# =========================
+# Sharding tabel per bulan
+# =========================
+MANIFEST_TAB = "_MANIFEST"
+_MANIFEST_LOCK = threading.Lock()
+MANIFEST_HEADER = ["table", "shard", "spreadsheet_id", "tab", "start_date", "end_date", "rows", "cols", "updated_at"]
+
+
+# spreadsheet id -> (punya tab _MANIFEST?, waktu cek). Hasil positif tidak kedaluwarsa
+# (manifest tidak pernah dihapus); hasil negatif dicek ulang setelah TTL, jadi run
+# tanpa sharding tidak menambah request spreadsheets.get di tiap Process/Load DB.
+MANIFEST_CACHE_TTL_S = 600
+_MANIFEST_SEEN: Dict[str, Tuple[bool, float]] = {}
+
+
+def has_manifest(service, spreadsheet_id: str) -> bool:
+    seen = _MANIFEST_SEEN.get(spreadsheet_id)
+    if seen is not None and (seen[0] or time.time() - seen[1] < MANIFEST_CACHE_TTL_S):
+        return seen[0]
+    present = MANIFEST_TAB in list_tabs(service, spreadsheet_id)
+    _MANIFEST_SEEN[spreadsheet_id] = (present, time.time())
+    return present
+
+
+def shard_of(date_str: str) -> str:
+    # shard = bulan kalender dari tanggal "YYYY-MM-DD"
+    return str(date_str)[:7]
+
+
+class ShardedTable:
+    """Tabel logis yang dipecah per bulan ke tab ``<table>_<YYYY_MM>``, dicatat di tab ``_MANIFEST``."""
+
+    def __init__(self, service, home_id: str, table: str, pool_ids: Optional[List[str]] = None, make_service=None):
+        self.service = service
+        self.home_id = home_id
+        self.table = table
+        self.has_pool = bool(pool_ids)
+        self.pool_ids = list(pool_ids) if pool_ids else [home_id]
+        self.make_service = make_service
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._tabs: Dict[str, Dict[str, int]] = {}
+
+    @property
+    def sharded(self) -> bool:
+        return bool(self.entries)
+
+    @property
+    def total_rows(self) -> int:
+        # jumlah baris seluruh tabel menurut manifest (tanpa membaca shard)
+        return sum(e["rows"] for e in self.entries.values())
+
+    def _read_manifest(self) -> Tuple[Dict[str, Dict[str, Any]], List[List[Any]]]:
+        entries: Dict[str, Dict[str, Any]] = {}
+        other_rows: List[List[Any]] = []
+        if not has_manifest(self.service, self.home_id):
+            return entries, other_rows
+        values = get_values(self.service, self.home_id, f"{MANIFEST_TAB}!A1:Z")
+        for row in values[1:]:
+            row = (list(row) + [""] * len(MANIFEST_HEADER))[:len(MANIFEST_HEADER)]
+            e = dict(zip(MANIFEST_HEADER, row))
+            if e["table"] != self.table:
+                # manifest bisa dipakai bersama tabel lain di spreadsheet yang sama
+                other_rows.append(row)
+                continue
+            e["rows"] = int(e["rows"] or 0)
+            e["cols"] = int(e["cols"] or 0)
+            entries[e["shard"]] = e
+        return entries, other_rows
+
+    def load_manifest(self) -> "ShardedTable":
+        self.entries, _ = self._read_manifest()
+        return self
+
+    def save_manifest(self):
+        # baris tabel lain dibaca ulang tepat sebelum menulis (OUTPUT_A/B bisa
+        # sync paralel ke manifest yang sama)
+        with _MANIFEST_LOCK:
+            ensure_tab(self.service, self.home_id, MANIFEST_TAB)
+            self._tabs.pop(self.home_id, None)
+            _MANIFEST_SEEN[self.home_id] = (True, time.time())
+            _, other_rows = self._read_manifest()
+            rows = [[e[c] for c in MANIFEST_HEADER] for _, e in sorted(self.entries.items())]
+            clear_values(self.service, self.home_id, f"{MANIFEST_TAB}!A1:Z")
+            write_values(self.service, self.home_id, f"{MANIFEST_TAB}!A1", [MANIFEST_HEADER] + other_rows + rows)
+
+    def shards_overlapping(self, start: Optional[str] = None, end: Optional[str] = None) -> List[str]:
+        out = []
+        for shard, e in sorted(self.entries.items()):
+            if start is not None and e["end_date"] < str(start):
+                continue
+            if end is not None and e["start_date"] > str(end):
+                continue
+            out.append(shard)
+        return out
+
+    def read_shards(self, shards: List[str], max_workers: int = 4) -> List[List[List[Any]]]:
+        """Baca shard secara paralel; satu values (header + rows) per shard."""
+        ranges = [(self.entries[s]["spreadsheet_id"], f"{self.entries[s]['tab']}!A1:ZZ") for s in shards]
+        make_service = self.make_service or (lambda: self.service)
+        return read_ranges_parallel(make_service, ranges, max_workers=max_workers, value_render_option=UNFORMATTED)
+
+    def _tabs_of(self, spreadsheet_id: str) -> Dict[str, int]:
+        if spreadsheet_id not in self._tabs:
+            self._tabs[spreadsheet_id] = list_tabs(self.service, spreadsheet_id)
+        return self._tabs[spreadsheet_id]
+
+    def _pick_spreadsheet(self) -> str:
+        load = {sid: 0 for sid in self.pool_ids}
+        for e in self.entries.values():
+            if e["spreadsheet_id"] in load:
+                load[e["spreadsheet_id"]] += e["rows"] * e["cols"]
+        return min(self.pool_ids, key=lambda sid: load[sid])
+
+    def write_shard(
+        self, shard: str, values: List[List[Any]], start_date: str, end_date: str, max_bytes: Optional[int] = None
+    ):
+        """Tulis ulang satu shard (header + rows) dan perbarui entry manifest-nya."""
+        e = self.entries.get(shard)
+        if e is None:
+            e = {
+                "table": self.table,
+                "shard": shard,
+                "spreadsheet_id": self._pick_spreadsheet(),
+                "tab": f"{self.table}_{shard.replace('-', '_')}",
+            }
+        sid, tab = e["spreadsheet_id"], e["tab"]
+        if tab not in self._tabs_of(sid):
+            ensure_tab(self.service, sid, tab)
+            self._tabs.pop(sid, None)
+        else:
+            # shard bisa menyusut (retensi), jadi bersihkan dulu
+            clear_values(self.service, sid, f"{tab}!A1:ZZ")
+        write_values_chunked(self.service, sid, tab, values, max_bytes)
+
+        e.update({
+            "start_date": start_date,
+            "end_date": end_date,
+            "rows": max(len(values) - 1, 0),
+            "cols": len(values[0]) if values else 0,
+            "updated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        })
+        self.entries[shard] = e
+
+    def has_tab(self, spreadsheet_id: str, tab: str) -> bool:
+        return tab in self._tabs_of(spreadsheet_id)
+
+    def drop_shard(self, shard: str):
+        e = self.entries.pop(shard, None)
+        if e is None:
+            return
+        self.delete_tab(e["spreadsheet_id"], e["tab"])
+
+    def delete_tab(self, sid: str, tab: str):
+        # deleteSheet membebaskan grid-nya; clear saja tetap menghitung sel ke batas spreadsheet
+        tabs = self._tabs_of(sid)
+        if tab not in tabs:
+            return
+        if len(tabs) > 1:
+            batch_update(self.service, sid, [{"deleteSheet": {"sheetId": tabs[tab]}}])
+            self._tabs.pop(sid, None)
+        else:
+            # spreadsheet tidak boleh tanpa tab: cukup kosongkan
+            clear_values(self.service, sid, f"{tab}!A1:ZZ")
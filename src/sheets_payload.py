@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from typing import Any, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_DECIMALS = 4
+
+# kolom teks dari Sheets tidak pernah dikonversi ke angka
+TEXT_COLS = ("Tanggal Perdagangan Terakhir", "Tanggal Akhir Bar", "Kode Saham", "Nama Perusahaan", "Remarks")
+
+# di luar range ini float64 tidak bisa direpresentasikan tepat sebagai int
+_MAX_EXACT_INT = 2 ** 53
+
+
+def _float_cells(v: np.ndarray, decimals: Optional[int]) -> np.ndarray:
+    # float -> object array: NaN/inf jadi "", bilangan bulat jadi int, sisanya (dibulatkan) float
+    v = np.asarray(v, dtype="float64")
+    finite = np.isfinite(v)
+    if decimals is not None:
+        v = np.round(v, decimals)
+    whole = finite & (v == np.floor(np.where(finite, v, 0))) & (np.abs(np.where(finite, v, 0)) < _MAX_EXACT_INT)
+
+    out = v.astype(object)
+    out[~finite] = ""
+    if whole.any():
+        out[whole] = v[whole].astype(np.int64).astype(object)
+    return out
+
+
+def _column_cells(s: pd.Series, decimals: Optional[int], text: bool) -> np.ndarray:
+    """Satu kolom -> object array nilai siap JSON (tanpa boxing per sel lewat DataFrame)."""
+    if pd.api.types.is_bool_dtype(s.dtype) and not s.hasnans:
+        return s.to_numpy(dtype=bool).astype(object)
+    if pd.api.types.is_integer_dtype(s.dtype) and not s.hasnans:
+        return s.to_numpy(dtype=np.int64).astype(object)
+    if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+        return _float_cells(s.to_numpy(dtype="float64", na_value=np.nan), decimals)
+    if pd.api.types.is_datetime64_any_dtype(s.dtype):
+        d = pd.to_datetime(s)
+        out = d.dt.strftime("%Y-%m-%d").to_numpy(dtype=object).copy()
+        out[d.isna().to_numpy()] = ""
+        return out
+
+    # object/string: nilai lama dari Sheets datang sebagai teks, jadi angka di-parse
+    # ulang supaya ditulis sebagai angka (dan ikut dibulatkan)
+    raw = s.to_numpy(dtype=object)
+    missing = pd.isna(raw)
+    out = raw.copy()
+    out[missing] = ""
+    if text:
+        return out
+    present = ~missing & (out != "")
+    try:
+        # jalur cepat: semua sel terisi berupa angka (kasus umum kolom numerik dari Sheets)
+        num = out[present].astype("float64")
+        is_num = present
+    except (TypeError, ValueError):
+        num_all = pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        is_num = present & ~np.isnan(num_all)
+        num = num_all[is_num]
+    if is_num.any():
+        out[is_num] = _float_cells(num, decimals)
+    return out
+
+
+def cast_sheet_numbers(df: pd.DataFrame) -> pd.DataFrame:
+    """Kolom hasil baca Sheets yang seluruh isinya angka -> float64 (sel kosong jadi NaN)."""
+    out = df.copy()
+    for c in out.columns:
+        if c in TEXT_COLS or pd.api.types.is_numeric_dtype(out[c].dtype):
+            continue
+        raw = out[c].to_numpy(dtype=object)
+        present = ~pd.isna(raw) & (raw != "")
+        try:
+            num = raw[present].astype("float64")
+        except (TypeError, ValueError):
+            continue
+        col = np.full(len(raw), np.nan)
+        col[present] = num
+        out[c] = col
+    return out
+
+
+def df_to_values(
+    df: pd.DataFrame,
+    decimals: Optional[int] = DEFAULT_DECIMALS,
+    round_cols: Iterable[str] = (),
+) -> List[List[Any]]:
+    """DataFrame -> ``[header] + rows`` untuk Sheets API, dikonversi per kolom."""
+    round_cols = set(round_cols)
+    grid = np.empty((len(df), len(df.columns)), dtype=object)
+    for j, c in enumerate(df.columns):
+        grid[:, j] = _column_cells(df[c], decimals if c in round_cols else None, c in TEXT_COLS)
+    return [df.columns.tolist()] + grid.tolist()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+DATE_COL = "Tanggal Perdagangan Terakhir"
+TICKER_COL = "Kode Saham"
+
+
+class TickerIndex:
+    """Histori urut (emiten, tanggal) + offset emiten -> [start, end) untuk slice cepat."""
+
+    def __init__(self, df: pd.DataFrame):
+        d = pd.to_datetime(df[DATE_COL], errors="coerce")
+        keep = d.notna().to_numpy()
+        df = df.loc[keep]
+        d = d[keep]
+
+        tickers = df[TICKER_COL].astype(str).to_numpy()
+        order = np.lexsort((d.to_numpy(), tickers))
+
+        self.frame = df.iloc[order].reset_index(drop=True)
+        self.frame[DATE_COL] = d.iloc[order].to_numpy()
+
+        sorted_tickers = tickers[order]
+        uniq, starts = np.unique(sorted_tickers, return_index=True)
+        ends = np.append(starts[1:], len(sorted_tickers))
+        self.offsets: Dict[str, Tuple[int, int]] = {
+            t: (int(s), int(e)) for t, s, e in zip(uniq, starts, ends)
+        }
+
+    @property
+    def tickers(self) -> List[str]:
+        return list(self.offsets)
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self.offsets
+
+    def history(self, ticker: str, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """Histori satu emiten, index tanggal; kolom yang diminta di-cast numerik."""
+        if ticker not in self.offsets:
+            raise KeyError(f"Kode Saham tidak ada di histori: {ticker}")
+        start, end = self.offsets[ticker]
+        part = self.frame.iloc[start:end]
+
+        out = pd.DataFrame(index=pd.DatetimeIndex(part[DATE_COL], name=DATE_COL))
+        for c in columns or []:
+            if c in part.columns:
+                # cast per slice saja (ratusan baris), bukan seluruh frame
+                out[c] = pd.to_numeric(part[c], errors="coerce").to_numpy()
+        return out
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+
+DATE_COL = "Tanggal Perdagangan Terakhir"
+TICKER_COL = "Kode Saham"
+
+DEFAULT_LEDGER_DIR = "upload_ledger"
+LEDGER_FILE = "ledger.json"
+MAX_ENTRIES = 200
+
+
+def file_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def target_key(spreadsheet_ids: Dict[str, Optional[str]]) -> str:
+    # file yang sama ke database lain tetap harus diproses
+    ids = {k: v for k, v in spreadsheet_ids.items() if v}
+    return hashlib.sha256(json.dumps(ids, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _keys_of(df: pd.DataFrame) -> Dict[str, List[str]]:
+    # (tanggal, emiten) yang dihasilkan file, ringkas: tanggal -> daftar emiten
+    d = df[DATE_COL].astype(str).to_numpy()
+    t = df[TICKER_COL].astype(str).to_numpy()
+    out: Dict[str, List[str]] = {}
+    for date in sorted(set(d)):
+        out[date] = sorted(set(t[d == date]))
+    return out
+
+
+def _overlaps(a: Dict[str, List[str]], b: Dict[str, List[str]]) -> bool:
+    for date in set(a) & set(b):
+        if set(a[date]) & set(b[date]):
+            return True
+    return False
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class UploadLedger:
+    """Catatan persisten file upload per hash isi (sha256) di ``<root>/ledger.json``."""
+
+    def __init__(self, root: str = DEFAULT_LEDGER_DIR):
+        self.root = root
+        self.path = os.path.join(root, LEDGER_FILE)
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # ledger rusak tidak boleh menghalangi upload; mulai dari kosong
+            return {}
+
+    def _write(self, entries: Dict[str, Dict[str, Any]]):
+        os.makedirs(self.root, exist_ok=True)
+        if len(entries) > MAX_ENTRIES:
+            oldest = sorted(entries, key=lambda k: entries[k].get("seen_at", ""))
+            for digest in oldest[: len(entries) - MAX_ENTRIES]:
+                entries.pop(digest)
+                for p in (self._frame_path(digest), self._export_path(digest)):
+                    if os.path.exists(p):
+                        os.remove(p)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.path)
+
+    # frame hasil Validate (dipakai ulang tanpa parse) dan file download Process terakhir
+    def _frame_path(self, digest: str) -> str:
+        return os.path.join(self.root, "frames", f"{digest}.pkl")
+
+    def _export_path(self, digest: str) -> str:
+        return os.path.join(self.root, "exports", f"{digest}.xlsx")
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._read().get(digest)
+
+    def cached_frame(self, digest: str) -> Optional[pd.DataFrame]:
+        """Frame hasil Validate untuk file dengan isi identik, kalau ada."""
+        p = self._frame_path(digest)
+        if self.get(digest) is None or not os.path.exists(p):
+            return None
+        try:
+            return pd.read_pickle(p)
+        except (OSError, EOFError, pickle.UnpicklingError, ImportError, AttributeError, TypeError, ValueError):
+            # pickle terpotong / dari versi pandas lain: buang entri, Validate parse ulang
+            self.forget(digest)
+            return None
+
+    def forget(self, digest: str):
+        with self._lock:
+            entries = self._read()
+            entries.pop(digest, None)
+            self._write(entries)
+        for p in (self._frame_path(digest), self._export_path(digest)):
+            if os.path.exists(p):
+                os.remove(p)
+
+    def record_validated(self, digest: str, file_name: str, validated_df: pd.DataFrame):
+        os.makedirs(os.path.dirname(self._frame_path(digest)), exist_ok=True)
+        tmp = self._frame_path(digest) + ".tmp"
+        validated_df.to_pickle(tmp)
+        os.replace(tmp, self._frame_path(digest))
+        with self._lock:
+            entries = self._read()
+            e = entries.setdefault(digest, {"processed": {}})
+            e.update({
+                "file_name": file_name,
+                "rows": len(validated_df),
+                "keys": _keys_of(validated_df),
+                "validated_at": _now(),
+                "seen_at": _now(),
+            })
+            self._write(entries)
+
+    def processed_result(self, digest: str, target: str) -> Optional[Dict[str, Any]]:
+        """Ringkasan + file download run sebelumnya bila file ini masih berlaku di target."""
+        e = self.get(digest)
+        if e is None or target not in e.get("processed", {}):
+            return None
+        p = self._export_path(digest)
+        if not os.path.exists(p):
+            return None
+        out = dict(e["processed"][target]["summary"])
+        with open(p, "rb") as f:
+            out["xbytes"] = f.read()
+        return out
+
+    def _invalidate_overlapping(self, entries: Dict[str, Dict[str, Any]], digest: str, target: str, include_self: bool):
+        keys = entries.get(digest, {}).get("keys", {})
+        for other, oe in entries.items():
+            if other == digest and not include_self:
+                continue
+            if target in oe.get("processed", {}) and _overlaps(oe.get("keys", {}), keys):
+                oe["processed"].pop(target)
+
+    def begin_processing(self, digest: str, target: str):
+        """Sebelum upsert ke target: entri dengan key overlap tidak berlaku lagi."""
+        with self._lock:
+            entries = self._read()
+            e = entries.setdefault(digest, {"processed": {}, "keys": {}})
+            self._invalidate_overlapping(entries, digest, target, include_self=True)
+            e.setdefault("in_flight", {})[target] = _now()
+            e["seen_at"] = _now()
+            self._write(entries)
+
+    def record_processed(self, digest: str, target: str, result: Dict[str, Any]):
+        """Catat file sudah di-upsert ke target; file lain dengan key overlap jadi tidak berlaku."""
+        os.makedirs(os.path.dirname(self._export_path(digest)), exist_ok=True)
+        tmp = self._export_path(digest) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(result["xbytes"])
+        os.replace(tmp, self._export_path(digest))
+
+        summary = {
+            k: result[k]
+            for k in ("file_name", "raw_rows", "out_a_rows", "out_b_rows", "bar_rows", "bar_history", "raw_last_dates")
+            if k in result
+        }
+        with self._lock:
+            entries = self._read()
+            e = entries.setdefault(digest, {"processed": {}, "keys": {}})
+            # run lain bisa selesai di antara begin_processing dan sekarang
+            self._invalidate_overlapping(entries, digest, target, include_self=False)
+            e.get("in_flight", {}).pop(target, None)
+            e["processed"][target] = {"at": _now(), "summary": summary}
+            e["seen_at"] = _now()
+            self._write(entries)
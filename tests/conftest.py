@@ -0,0 +1,5 @@
+import os
+import sys
+
+# src/ diimpor sebagai package dari root repo (seperti saat streamlit run app.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import re
+import threading
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.cleaning import parse_and_cast
+from src.schema import CANON_COLS_28, normalize_and_validate_columns
+
+
+def _tab(a1_range: str) -> str:
+    return a1_range.split("!")[0]
+
+
+def _start_row(a1_range: str) -> int:
+    m = re.search(r"!A(\d+)", a1_range)
+    return int(m.group(1)) - 1 if m else 0
+
+
+class _Request:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def execute(self):
+        return self.fn()
+
+
+class FakeSheets:
+    """Pengganti Sheets API v4 di memori: values get/update/clear, get (daftar tab), batchUpdate."""
+
+    def __init__(self, tabs: List[Tuple[str, str]] = ()):
+        self.tabs: Dict[str, Dict[str, int]] = {}
+        self.cells: Dict[Tuple[str, str], List[List[Any]]] = {}
+        self.calls: List[Tuple[Any, ...]] = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+        for sid, title in tabs:
+            self.add_tab(sid, title)
+
+    def add_tab(self, sid: str, title: str):
+        if title not in self.tabs.setdefault(sid, {}):
+            self.tabs[sid][title] = self._next_id
+            self._next_id += 1
+            self.cells[(sid, title)] = []
+
+    def has_tab(self, sid: str, title: str) -> bool:
+        return title in self.tabs.get(sid, {})
+
+    # --- permukaan API yang dipakai src.sheets_client
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range=None, fields=None, valueRenderOption=None):
+        if range is None:
+            return _Request(lambda: {
+                "sheets": [{"properties": {"title": t, "sheetId": i}} for t, i in self.tabs.get(spreadsheetId, {}).items()]
+            })
+
+        def f():
+            with self._lock:
+                self.calls.append(("get", spreadsheetId, range))
+                if not self.has_tab(spreadsheetId, _tab(range)):
+                    raise RuntimeError(f"Unable to parse range: {range}")
+                rows = self.cells[(spreadsheetId, _tab(range))][_start_row(range):]
+            if valueRenderOption == "UNFORMATTED_VALUE":
+                out = [list(r) for r in rows]
+            else:
+                out = [["" if c is None else str(c) for c in r] for r in rows]
+            return {"values": out} if out else {}
+        return _Request(f)
+
+    def update(self, spreadsheetId, range, valueInputOption, body):
+        def f():
+            with self._lock:
+                self.calls.append(("update", spreadsheetId, range))
+                if not self.has_tab(spreadsheetId, _tab(range)):
+                    raise RuntimeError(f"Unable to parse range: {range}")
+                cur = self.cells[(spreadsheetId, _tab(range))]
+                start = _start_row(range)
+                for i, row in enumerate(body["values"]):
+                    while len(cur) <= start + i:
+                        cur.append([])
+                    cur[start + i] = list(row)
+            return {}
+        return _Request(f)
+
+    def clear(self, spreadsheetId, range, body=None):
+        def f():
+            with self._lock:
+                self.calls.append(("clear", spreadsheetId, range))
+                self.cells[(spreadsheetId, _tab(range))] = []
+            return {}
+        return _Request(f)
+
+    def batchUpdate(self, spreadsheetId, body):
+        def f():
+            with self._lock:
+                self.calls.append(("batchUpdate", spreadsheetId, body))
+                for r in body["requests"]:
+                    if "addSheet" in r:
+                        self.add_tab(spreadsheetId, r["addSheet"]["properties"]["title"])
+                    if "deleteSheet" in r:
+                        tabs = self.tabs[spreadsheetId]
+                        title = next(t for t, i in tabs.items() if i == r["deleteSheet"]["sheetId"])
+                        del tabs[title]
+                        del self.cells[(spreadsheetId, title)]
+            return {}
+        return _Request(f)
+
+
+def make_days(n_days: int, n_tickers: int, start: str = "2024-01-01", seed: int = 0) -> List[pd.DataFrame]:
+    # satu frame tervalidasi (seperti hasil Validate) per hari bursa
+    rng = np.random.default_rng(seed)
+    tickers = [f"T{i:03d}" for i in range(n_tickers)]
+    out = []
+    for d in pd.bdate_range(start, periods=n_days):
+        df = pd.DataFrame({c: rng.integers(1, 1000, n_tickers) for c in CANON_COLS_28})
+        df["No"] = np.arange(1, n_tickers + 1)
+        df["Kode Saham"] = tickers
+        df["Nama Perusahaan"] = [f"PT {t}" for t in tickers]
+        df["Remarks"] = ""
+        df["Tanggal Perdagangan Terakhir"] = d.date()
+        base = rng.uniform(100, 200, n_tickers).round(0)
+        df["Open Price"] = base
+        df["Penutupan"] = base
+        df["Tertinggi"] = (base * 1.02).round(0)
+        df["Terendah"] = (base * 0.98).round(0)
+        out.append(parse_and_cast(normalize_and_validate_columns(df[CANON_COLS_28])))
+    return out
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from src.history import KEY2, SortedHistory, _upsert_by_key
+from src.pipeline import _sort_date_emiten
+
+from fake_sheets import make_days
+
+
+def _as_sheet(df):
+    # seperti hasil baca Sheets: tanggal berupa string YYYY-MM-DD
+    out = df.copy()
+    out["Tanggal Perdagangan Terakhir"] = out["Tanggal Perdagangan Terakhir"].astype(str)
+    return out.reset_index(drop=True)
+
+
+def _reference(existing, incoming):
+    # jalur lama: upsert by key lalu sort ulang seluruh tabel
+    out = _upsert_by_key(existing.copy(), incoming.copy(), KEY2)
+    return _sort_date_emiten(out).reset_index(drop=True)
+
+
+def test_merge_matches_upsert_then_sort():
+    days = [_as_sheet(d) for d in make_days(12, 6)]
+    # histori lama tanpa hari ke-5 dan ke-11, emiten T005 baru muncul di hari ke-8
+    existing = pd.concat([d for k, d in enumerate(days) if k not in (5, 11)], ignore_index=True)
+    existing = existing[~((existing["Tanggal Perdagangan Terakhir"] >= days[8]["Tanggal Perdagangan Terakhir"][0])
+                          & (existing["Kode Saham"] == "T005"))].reset_index(drop=True)
+
+    corrected = days[8].copy()
+    corrected["Penutupan"] = corrected["Penutupan"] + 1
+    incoming = pd.concat([days[5], corrected, days[11]], ignore_index=True).sample(frac=1, random_state=0)
+
+    got = SortedHistory.from_frame(existing).upsert(incoming).frame
+    pd.testing.assert_frame_equal(got, _reference(existing, incoming))
+
+
+def test_merge_with_new_column_fills_blank():
+    days = [_as_sheet(d) for d in make_days(4, 3)]
+    existing = pd.concat(days[:3], ignore_index=True)
+    incoming = days[3].assign(Extra=1.5)
+
+    got = SortedHistory.from_frame(existing).upsert(incoming).frame
+    expected = _reference(existing, incoming)
+    pd.testing.assert_frame_equal(got, expected)
+    assert (got["Extra"].iloc[:9] == "").all()
+
+
+def test_by_ticker_matches_sort_by_ticker_then_date():
+    days = [_as_sheet(d) for d in make_days(15, 7)]
+    hist = SortedHistory.from_frame(pd.concat(days, ignore_index=True))
+
+    got = hist.by_ticker()
+    expected = hist.frame.sort_values(["Kode Saham", "Tanggal Perdagangan Terakhir"], kind="mergesort")
+    np.testing.assert_array_equal(got["Kode Saham"].to_numpy(), expected["Kode Saham"].to_numpy())
+    np.testing.assert_array_equal(
+        got["Tanggal Perdagangan Terakhir"].to_numpy().astype("datetime64[D]").astype(str),
+        expected["Tanggal Perdagangan Terakhir"].to_numpy(),
+    )
@@ -0,0 +1,123 @@
+import pandas as pd
+import pytest
+
+import src.pipeline as P
+import src.sheets_client as SC
+from src.cold_store import ColdStore
+from src.sheets_client import MANIFEST_TAB, ShardedTable
+
+from fake_sheets import FakeSheets, make_days
+
+IDS = {"RAW": "r", "OUTPUT_A": "a", "OUTPUT_B": "b"}
+POOLS = {"RAW": ["r1", "r2"], "OUTPUT_A": ["a1"], "OUTPUT_B": ["b1"]}
+
+
+@pytest.fixture
+def sheets(monkeypatch):
+    svc = FakeSheets([("r", "RAW"), ("a", "OUTPUT_A"), ("b", "OUTPUT_B")])
+    for pool in POOLS.values():
+        for sid in pool:
+            svc.add_tab(sid, "Sheet1")
+    monkeypatch.setattr(P, "build_sheets_service", lambda info: svc)
+    monkeypatch.setattr(SC, "_MANIFEST_SEEN", {})
+    return svc
+
+
+def _run(days, first_sharded=None, ids=IDS, pools=POOLS, **kwargs):
+    # hari pertama di-bulk (histori awal), sisanya satu Process per hari
+    P.run_process({}, ids, pd.concat(days[:-5], ignore_index=True), **kwargs)
+    for k, day in enumerate(days[-5:]):
+        sharding = first_sharded is not None and k >= first_sharded
+        P.run_process({}, ids, day, sharding=sharding, shard_pools=pools, **kwargs)
+
+
+def _read_all(svc, ids=IDS):
+    return {t: P.read_table_df(svc, {}, sid, t) for t, sid in ids.items()}
+
+
+def test_migration_matches_single_tab_and_deletes_legacy_tab(sheets, monkeypatch):
+    days = make_days(45, 6)
+    legacy = FakeSheets([("r", "RAW"), ("a", "OUTPUT_A"), ("b", "OUTPUT_B")])
+    monkeypatch.setattr(P, "build_sheets_service", lambda info: legacy)
+    _run(days)
+    expected = _read_all(legacy)
+
+    monkeypatch.setattr(P, "build_sheets_service", lambda info: sheets)
+    _run(days, first_sharded=2)
+    got = _read_all(sheets)
+
+    for t in IDS:
+        pd.testing.assert_frame_equal(got[t], expected[t])
+    for t, sid in IDS.items():
+        assert not sheets.has_tab(sid, t)
+        assert sheets.has_tab(sid, MANIFEST_TAB)
+    shard_tabs = [t for sid in POOLS["RAW"] for t in sheets.tabs[sid] if t.startswith("RAW_")]
+    assert sorted(shard_tabs) == ["RAW_2024_01", "RAW_2024_02", "RAW_2024_03"]
+
+
+def test_sharding_without_pool_keeps_single_tab(sheets):
+    _run(make_days(20, 4), first_sharded=0, pools={})
+    for t, sid in IDS.items():
+        assert sheets.has_tab(sid, t)
+        assert not sheets.has_tab(sid, MANIFEST_TAB)
+
+
+def test_migration_without_pool_is_refused(sheets):
+    st_table = ShardedTable(sheets, "r", "RAW").load_manifest()
+    with pytest.raises(ValueError):
+        P._sync_sharded(sheets, st_table, make_days(1, 3)[0])
+
+
+def test_retention_drops_expired_shards(sheets, monkeypatch, tmp_path):
+    monkeypatch.setattr(P, "KEEP_DAYS", 20)
+    days = make_days(45, 4)
+    P.run_process({}, IDS, pd.concat(days[:25], ignore_index=True), cold_dir=str(tmp_path))
+    for day in days[25:]:
+        P.run_process({}, IDS, day, sharding=True, shard_pools=POOLS, cold_dir=str(tmp_path))
+
+    hot_dates = sorted({str(d["Tanggal Perdagangan Terakhir"].iloc[0]) for d in days[-20:]})
+    for t, sid in IDS.items():
+        st_table = ShardedTable(sheets, sid, t).load_manifest()
+        assert min(e["end_date"] for e in st_table.entries.values()) >= hot_dates[0]
+        df = P.read_table_df(sheets, {}, sid, t)
+        assert sorted(df["Tanggal Perdagangan Terakhir"].unique()) == hot_dates
+        assert st_table.total_rows == len(df)
+        # tab shard yang sudah dibuang ikut dihapus dari pool
+        live = {(e["spreadsheet_id"], e["tab"]) for e in st_table.entries.values()}
+        for pool_sid in POOLS[t]:
+            for tab in sheets.tabs[pool_sid]:
+                assert tab == "Sheet1" or (pool_sid, tab) in live
+
+    # baris yang keluar hot window diarsip, bukan dibuang
+    archived = ColdStore(str(tmp_path), "RAW").read()
+    all_dates = sorted({str(d["Tanggal Perdagangan Terakhir"].iloc[0]) for d in days})
+    assert sorted(archived["Tanggal Perdagangan Terakhir"].unique()) == all_dates[:-20]
+
+
+def test_shared_manifest_survives_parallel_output_saves(sheets):
+    # OUTPUT_A dan OUTPUT_B di spreadsheet yang sama: manifest ditulis paralel oleh dua thread
+    ids = {"RAW": "r", "OUTPUT_A": "o", "OUTPUT_B": "o"}
+    sheets.add_tab("o", "OUTPUT_A")
+    sheets.add_tab("o", "OUTPUT_B")
+    _run(make_days(30, 5), first_sharded=0, ids=ids)
+
+    SC._MANIFEST_SEEN.clear()
+    for t in ("OUTPUT_A", "OUTPUT_B"):
+        st_table = ShardedTable(sheets, "o", t).load_manifest()
+        assert st_table.sharded
+        assert all(sheets.has_tab(e["spreadsheet_id"], e["tab"]) for e in st_table.entries.values())
+        df = P.read_table_df(sheets, {}, "o", t)
+        assert st_table.total_rows == len(df) == 30 * 5
+
+
+def test_read_table_df_reads_only_overlapping_shards(sheets):
+    _run(make_days(45, 3), first_sharded=0)
+    full = P.read_table_df(sheets, {}, "r", "RAW")
+    sheets.calls.clear()
+    part = P.read_table_df(sheets, {}, "r", "RAW", start="2024-02-05", end="2024-02-09")
+
+    shard_gets = [c for c in sheets.calls if c[0] == "get" and not c[2].startswith(MANIFEST_TAB)]
+    assert [c[2].split("!")[0] for c in shard_gets] == ["RAW_2024_02"]
+    dates = full["Tanggal Perdagangan Terakhir"]
+    expected = full[(dates >= "2024-02-05") & (dates <= "2024-02-09")].reset_index(drop=True)
+    pd.testing.assert_frame_equal(part, expected)
@@ -0,0 +1,83 @@
+import pytest
+
+from src.upload_ledger import UploadLedger
+
+from fake_sheets import make_days
+
+TARGET = "t1"
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return UploadLedger(str(tmp_path / "ledger"))
+
+
+@pytest.fixture
+def frames():
+    day0, day1 = make_days(2, 4)
+    fixed = day0.copy()
+    fixed["Penutupan"] = fixed["Penutupan"] + 1
+    return {"d0": day0, "d0_fixed": fixed, "d1": day1}
+
+
+def _processed(ledger, digest, target=TARGET):
+    return ledger.processed_result(digest, target) is not None
+
+
+def _validate_and_process(ledger, frames, digests):
+    for d in digests:
+        ledger.record_validated(d, f"{d}.xlsx", frames[d])
+        ledger.record_processed(d, TARGET, {"xbytes": d.encode(), "raw_rows": len(frames[d])})
+
+
+def test_overlapping_file_invalidates_earlier_one(ledger, frames):
+    _validate_and_process(ledger, frames, ["d0", "d1", "d0_fixed"])
+    assert not _processed(ledger, "d0")
+    assert _processed(ledger, "d0_fixed")
+    assert _processed(ledger, "d1")
+    assert ledger.processed_result("d0_fixed", TARGET)["xbytes"] == b"d0_fixed"
+
+
+def test_other_target_is_not_invalidated(ledger, frames):
+    _validate_and_process(ledger, frames, ["d0"])
+    ledger.record_processed("d0", "t2", {"xbytes": b"x"})
+    _validate_and_process(ledger, frames, ["d0_fixed"])
+    assert not _processed(ledger, "d0")
+    assert _processed(ledger, "d0", "t2")
+
+
+def test_begin_processing_invalidates_before_write(ledger, frames):
+    _validate_and_process(ledger, frames, ["d0", "d1"])
+    ledger.record_validated("d0_fixed", "d0_fixed.xlsx", frames["d0_fixed"])
+
+    # run gagal setelah begin_processing: Sheets mungkin sudah setengah tertulis
+    ledger.begin_processing("d0_fixed", TARGET)
+    assert not _processed(ledger, "d0")
+    assert not _processed(ledger, "d0_fixed")
+    assert _processed(ledger, "d1")
+    assert TARGET in ledger.get("d0_fixed")["in_flight"]
+
+    ledger.record_processed("d0_fixed", TARGET, {"xbytes": b"ok"})
+    assert _processed(ledger, "d0_fixed")
+    assert ledger.get("d0_fixed")["in_flight"] == {}
+
+
+def test_reprocessing_same_file_invalidates_itself_until_done(ledger, frames):
+    _validate_and_process(ledger, frames, ["d0"])
+    ledger.begin_processing("d0", TARGET)
+    assert not _processed(ledger, "d0")
+
+
+def test_unreadable_cached_frame_is_a_miss(ledger, frames):
+    ledger.record_validated("d0", "d0.xlsx", frames["d0"])
+    path = ledger._frame_path("d0")
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[: len(data) // 2])
+
+    assert ledger.cached_frame("d0") is None
+    assert ledger.get("d0") is None
+
+    ledger.record_validated("d0", "d0.xlsx", frames["d0"])
+    assert ledger.cached_frame("d0").equals(frames["d0"])